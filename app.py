@@ -1,282 +1,422 @@
-from flask import Flask, render_template, jsonify
-import serial
+from flask import Flask, Response, g, render_template, jsonify, request
+import argparse
+import atexit
+import logging
+import math
+import os
+import signal
+import sys
 import threading
 import time
-import requests
 from datetime import datetime
-from collections import deque
+from notifier import COALESCED, DROPPED, NotificationDispatcher
+from stream import Broadcaster
+from history import HistoryStore
+from ingest import IngestionEngine, parse_devices
+from rules import RuleEngine
+from conditioning import SignalConditioner
+from bus import DEFAULT_ADDRESS, BusPublisher, BusSubscriber, bus_is_live
+from events import EventLog
+import logs
+import metrics
+from profiler import SamplingProfiler
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 
 # --- PUSHBULLET & NOTIFICATION LOG ---
-PUSHBULLET_TOKEN = API_KEY  # ← Your Pushbullet Token
-PUSHBULLET_API_URL = "https://api.pushbullet.com/v2/pushes"
+def load_env_file(path=".env"):
+    """Loads KEY=value lines from a .env file into os.environ (python-dotenv if installed)."""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    key, sep, value = line.partition("=")
+                    if sep and not key.strip().startswith("#"):
+                        os.environ.setdefault(key.strip(), value.strip().strip("\"'"))
+    else:
+        load_dotenv(path)
+
+# Files next to app.py are found from here, whatever directory the server was started from
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+load_env_file(os.path.join(APP_DIR, ".env"))
+# Log records are written by a background thread; HAZARD_LOG_FORMAT=json for one JSON object per line
+logs.setup_logging(os.environ.get("HAZARD_LOG_LEVEL", "INFO"), os.environ.get("HAZARD_LOG_FORMAT", "text"))
+log = logging.getLogger("hazard.app")
+PUSHBULLET_TOKEN = os.environ.get("API_KEY", "")  # ← Your Pushbullet Token, from .env
+PUSHBULLET_API_URL = os.environ.get("PUSHBULLET_API_URL", "https://api.pushbullet.com/v2/pushes")
 HEADERS = {
     "Access-Token": PUSHBULLET_TOKEN,
     "Content-Type": "application/json"
 }
-# A thread-safe, fixed-size queue to store the last 10 notifications
-notification_log = deque(maxlen=20) # Increased size for better logging
-
-# --- TIMING & THRESHOLD CONSTANTS FROM BRIEF ---
-# Notification timing and flags
-last_notif_time = {"soil": 0, "smoke": 0, "ldr": 0, "flame": 0}
-
-# Initial Notification Delay: Flame/Smoke: 0.5s, Moisture/LDR: 10s
-NOTIF_DELAY_S = {"soil": 5, "smoke": 0.2, "ldr": 5, "flame": 0.2} 
-
-# Hazard Escalation Delay: 30 seconds
-CRITICAL_ESCALATION_DELAY_S = 10
-
-sensor_data = {
-    "soil": 0, "smoke": 0, "ldr": 0, "flame": 1,
-    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-}
-
-# For Hazard Escalation Protocol
-critical_condition_active_since = {
-    "flame": 0,
-    "smoke": 0,
-    "soil_flood": 0,
-    "ldr_bright": 0
-}
-escalated_notification_sent_flag = {
-    "flame": False,
-    "smoke": False,
-    "soil_flood": False,
-    "ldr_bright": False
-}
-
-def send_pushbullet_notification(title, body, severity="info"):
-    """Sends a notification, logs it with a severity, and prints to console."""
-    payload = {"type": "note", "title": title, "body": body}
-    try:
-        res = requests.post(PUSHBULLET_API_URL, json=payload, headers=HEADERS)
-        if res.status_code == 200:
-            print(f"📨 Pushbullet notification sent: {title}")
-        else:
-            print(f"❌ Notification failed: {res.status_code} {res.text}")
-    except Exception as e:
-        print(f"⚠ Error sending Pushbullet notification: {e}")
-
-# Flags to avoid repeated alerts
-notified = {
-    "soil": False,
-    "smoke": False,
-    "ldr": False,
-    "flame": False
-}
-
-# Last notification timestamps
-lastnotif = {
-    "soil": 0,
-    "smoke": 0,
-    "ldr": 0,
-    "flame": 0
-}
-
-# Minimum seconds between notifications per sensor
-notifdelay = {
-    "soil": 10,    # notify once every 60 sec
-    "smoke": 0.1,
-    "ldr": 20,
-    "flame": 0   # more aggressive (0 sec)
-}
-
+# Sensor history and spilled notifications; every process (ingestion and web workers) must open the same file
+HISTORY_DB = os.environ.get("HAZARD_HISTORY_DB", os.path.join(APP_DIR, "history.db"))
+# Every notification raised, for the dashboard's /notifications feed. A background
+# writer spills them to the history database; the newest NOTIFICATION_MEMORY stay in memory
+NOTIFICATION_MEMORY = 1000
+NOTIFICATION_RETENTION_S = 30 * 86400
+notification_log = EventLog(HISTORY_DB,
+                            memory_events=NOTIFICATION_MEMORY, retention_s=NOTIFICATION_RETENTION_S)
+
+# --- HAZARD RULES ---
+# Thresholds, cooldowns, escalation and messages live in rules.json and are
+# picked up again whenever the file changes, without restarting the server.
+rule_engine = RuleEngine(os.path.join(APP_DIR, "rules.json"))
+
+# Sends happen on a background worker pool so the serial reader only enqueues
+notifier = NotificationDispatcher(PUSHBULLET_API_URL, HEADERS)
+
+def send_pushbullet_notification(title, body, severity="info", device=None, origin=None, sensor=None):
+    """Queues a notification for background delivery and logs it; never blocks on the network.
+
+    `origin` is the time the triggering reading came off the wire, for latency tracking.
+    Duplicates coalesced into an identical alert still in the queue are not logged again.
+    An alert dropped on a full queue is still logged, marked undelivered, so the
+    dashboard shows it even while Pushbullet is down.
+    """
+    if device and len(DEVICES) > 1:
+        title = f"[{device}] {title}"
+    status = notifier.submit(title, body, severity, origin=origin)
+    if status == COALESCED:
+        return
+    event = notification_log.append(title, body, severity, device=device, sensor=sensor, ts=origin,
+                                    undelivered=status == DROPPED)
+    if bus is not None:
+        bus.publish("notification", event)
 
 # --- FLASK & SERIAL SETUP ---
-app = Flask(__name__, template_folder="templates")
+# Pushes every parsed reading to the dashboards over /stream
+live_stream = Broadcaster()
+# Batched, on-disk sensor history with 1s/1m/1h rollups for /history
+history = HistoryStore(HISTORY_DB)
 SERIAL_PORT = 'COM5'     # Change if needed
 BAUD_RATE     = 9600
-ser           = None
-
-sensor_data = {
-    "soil": 0,
-    "smoke": 0,
-    "ldr": 0,
-    #"temperature":    still tracked but no sensor attached
-    "flame": 1
-}
+# More sectors: HAZARD_DEVICES="alpha=COM5,beta=/dev/ttyUSB0,gamma=tcp://10.0.0.7:4000"
+DEVICES = parse_devices(os.environ.get("HAZARD_DEVICES"), SERIAL_PORT)
+DEFAULT_DEVICE = next(iter(DEVICES))
+
+# Latest reading per device. Entries are replaced in place; the dict itself never is.
+sensor_data = {}
+
+# Rolling filters per device; rules see e.g. "smoke.median" instead of one raw sample
+SIGNAL_WINDOW = 16
+conditioners = {name: SignalConditioner(window=SIGNAL_WINDOW) for name in DEVICES}
+
+def handle_reading(device, ts, values):
+    """Runs one decoded reading from a device through the pipeline."""
+    soil, smoke, ldr, flame = values
+    reading = {
+        "device": device,
+        "soil": soil,
+        "smoke": smoke,
+        "ldr": ldr,
+        "flame": flame,
+        "timestamp": datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+    }
+    sensor_data[device] = reading
+    publish("reading", reading)
+    history.append(device, ts, reading)
+    check_and_send_notifications(conditioners[device].update(ts, values), device, ts)
+
+# One selector loop reads every configured port and reconnects dropped ones
+ingestion = IngestionEngine(DEVICES, handle_reading, BAUD_RATE)
+
+def check_and_send_notifications(data, device=None, ts=None):
+    """Runs the hazard rules over one reading and queues any notifications they raise.
+
+    `data` holds the raw values plus the conditioned "<sensor>.<feature>" signals.
+    """
+    device = device or DEFAULT_DEVICE
+    ts = ts or time.time()
+    for title, body, severity, sensor in rule_engine.evaluate(device, data, ts):
+        send_pushbullet_notification(title, body, severity, device=device, origin=ts, sensor=sensor)
+
+# --- SERVING MODES ---
+# standalone: `python app.py` reads the devices and serves HTTP in one process.
+# ingest:     `python app.py --ingest` owns the devices and publishes everything on the bus.
+# web:        wsgi.py workers (e.g. under gunicorn) follow the bus and only serve HTTP.
+ROLE = "standalone"
+BUS_ADDRESS = os.environ.get("HAZARD_BUS", DEFAULT_ADDRESS)
+STATUS_INTERVAL_S = 2
+bus = None
+# Ingestion-side counters as last published on the bus (web role)
+bus_status = {}
+
+def publish(event, data):
+    """Sends an event to this process's /stream clients and, when ingesting, to the web workers."""
+    live_stream.publish(event, data, device=data.get("device"))
+    if bus is not None:
+        bus.publish(event, data)
+
+def ingestion_status():
+    return {
+        "devices": ingestion.snapshot(),
+        "notifier": notifier.snapshot(),
+        "history": dict(history.stats),
+        "rules_version": rule_engine.version,
+        "read_lag": ingestion.read_lag.snapshot(),
+        "rule_eval": rule_engine.eval_time.snapshot(),
+        "notification_latency": notifier.latency.snapshot(),
+    }
+
+def bus_snapshot():
+    """What a web worker needs on connect: recent notifications, the latest reading per device and the counters."""
+    return ([("notification", e) for e in notification_log.tail()]
+            + [("reading", r) for r in list(sensor_data.values())]
+            + [("status", ingestion_status())])
+
+def publish_status():
+    while True:
+        time.sleep(STATUS_INTERVAL_S)
+        bus.publish("status", ingestion_status())
 
-def read_from_arduino():
-    global ser, sensor_data, notified
+def start_ingestion(publish_on_bus=False):
+    """Starts reading the devices, plus the bus publisher for the ingest role.
 
-    if ser is None:
-        print("❌ Serial port not available.")
-        return
-
-    while True:
-        if ser and ser.is_open:
-            try:
-                line = ser.readline().decode('utf-8').strip()
-                if line and len(line.split(',')) == 4:
-                    parts = line.split(',')
-                    sensor_data = {
-                        "soil": int(parts[0]),
-                        "smoke": int(parts[1]),
-                        "ldr": int(parts[2]),
-                        "flame": int(parts[3]),
-                        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    check_and_send_notifications(sensor_data)
-            except Exception as e:
-                print(f"⚠ Error reading serial or processing data: {e}")
-                time.sleep(2)
-        else:
-            time.sleep(5) # Wait before trying to reconnect
-
-def check_and_send_notifications(data):
-    """Checks sensor data and sends notifications based on the project brief."""
-    global last_notif_time, critical_condition_active_since, escalated_notification_sent_flag
-    current_time = time.time()
-
-    # --- 1. Flame Sensor (Thermal & Combustion Sensor) ---
-    is_flame_detected = data["flame"] == 0
-    if is_flame_detected:
-        if current_time - last_notif_time["flame"] > NOTIF_DELAY_S["flame"]:
-            send_pushbullet_notification(
-                "(NORMAL)🔥🔥 COMBUSTION EVENT DETECTED!",
-                "Active flame detected in Sector Alpha! Immediately trigger fire suppression system. Evacuate sector now!",
-                severity="critical"
-            )
-            last_notif_time["flame"] = current_time
-
-        if critical_condition_active_since["flame"] == 0:
-            critical_condition_active_since["flame"] = current_time
-            escalated_notification_sent_flag["flame"] = False
-        elif (current_time - critical_condition_active_since["flame"] > CRITICAL_ESCALATION_DELAY_S) and not escalated_notification_sent_flag["flame"]:
-            send_pushbullet_notification(
-                "(CRITICAL)🔥🔥 FIRE SPREADING!",
-                "Combustion has not been suppressed for 30 seconds. Structural integrity is compromised. Jettison module protocol is now advised.",
-                severity="escalation"
-            )
-            escalated_notification_sent_flag["flame"] = True
-    else:
-        critical_condition_active_since["flame"] = 0
-
-    # --- 2. MQ-2 (Atmospheric Purity Sensor) ---
-    is_gas_detected = data["smoke"] > 200
-    if is_gas_detected:
-        if current_time - last_notif_time["smoke"] > NOTIF_DELAY_S["smoke"]:
-            send_pushbullet_notification(
-                "(NORMAL)☣️ Cabin Air Contamination!",
-                f"Unidentified volatile gases detected. Possible electrical short or propellant leak. Advise immediate crew mask deployment. (Smoke: {data['smoke']})",
-                severity="critical"
-            )
-            last_notif_time["smoke"] = current_time
-
-        if critical_condition_active_since["smoke"] == 0:
-            critical_condition_active_since["smoke"] = current_time
-            escalated_notification_sent_flag["smoke"] = False
-        elif (current_time - critical_condition_active_since["smoke"] > CRITICAL_ESCALATION_DELAY_S) and not escalated_notification_sent_flag["smoke"]:
-            send_pushbullet_notification(
-                "(CRITICAL)☣️ ATMOSPHERE UNRECOVERABLE!",
-                "Air quality remains critical for 30 seconds. Life support cannot scrub contaminants. Seal all hatches and prepare for EVA.",
-                severity="escalation"
-            )
-            escalated_notification_sent_flag["smoke"] = True
-    else:
-        critical_condition_active_since["smoke"] = 0
-
-    # --- 3. Moisture Sensor (Coolant Leak & Condensation) ---
-    soil_value = data["soil"]
-    is_flood_risk = soil_value < 590
-    is_condensation_risk = 400 <= soil_value < 700
-
-    if is_flood_risk:
-        if current_time - last_notif_time["soil"] > NOTIF_DELAY_S["soil"]:
-            send_pushbullet_notification(
-                "(NORMAL)‼️ Alert: Fluid Leak Detected!",
-                f"High moisture levels detected. Possible coolant line or water reclamation failure. Activate containment protocol. (Soil: {soil_value})",
-                severity="critical"
-            )
-            last_notif_time["soil"] = current_time
-
-        if critical_condition_active_since["soil_flood"] == 0:
-            critical_condition_active_since["soil_flood"] = current_time
-            escalated_notification_sent_flag["soil_flood"] = False
-        elif (current_time - critical_condition_active_since["soil_flood"] > CRITICAL_ESCALATION_DELAY_S) and not escalated_notification_sent_flag["soil_flood"]:
-            send_pushbullet_notification(
-                "(CRITICAL)🚨 CATASTROPHIC FLOODING!",
-                "Fluid leak has been continuous for 30 seconds. Containment failure imminent. Immediate EVACUATION of the sector is required!",
-                severity="escalation"
-            )
-            escalated_notification_sent_flag["soil_flood"] = True
-    else:
-        critical_condition_active_since["soil_flood"] = 0
-        if is_condensation_risk and (current_time - last_notif_time["soil"] > NOTIF_DELAY_S["soil"]):
-            send_pushbullet_notification(
-                "(NORMAL)💧 Atmospheric Condensation Alert",
-                f"Humidity rising in Sector Gamma. Potential condensation on critical systems. Monitor telemetry. (Soil: {soil_value})",
-                severity="medium"
-            )
-            last_notif_time["soil"] = current_time
-
-    # --- 4. LDR (Ambient Light & Radiation Sensor) ---
-    ldr_value = data["ldr"]
-    is_extreme_luminosity = ldr_value <= 170
-    is_unstable_light = 270 < ldr_value <= 700
-    is_low_light = ldr_value > 700
-
-    if is_extreme_luminosity:
-        if current_time - last_notif_time["ldr"] > NOTIF_DELAY_S["ldr"]:
-            send_pushbullet_notification(
-                "(NORMAL)☀️ EXTREME LUMINOSITY EVENT!",
-                f"Warning: Light intensity exceeds solar flare predictions. Possible external proximity event or hull breach. AVOID VISUAL EXPOSURE. (LDR: {ldr_value})",
-                severity="critical"
-            )
-            last_notif_time["ldr"] = current_time
-
-        if critical_condition_active_since["ldr_bright"] == 0:
-            critical_condition_active_since["ldr_bright"] = current_time
-            escalated_notification_sent_flag["ldr_bright"] = False
-        elif (current_time - critical_condition_active_since["ldr_bright"] > CRITICAL_ESCALATION_DELAY_S) and not escalated_notification_sent_flag["ldr_bright"]:
-            send_pushbullet_notification(
-                "(CRITICALLLLLLL)☀️ HULL BREACH CONFIRMED!",
-                "Extreme light exposure has been sustained for 30 seconds. Assume hull integrity is compromised. All crew to designated safe zones immediately.",
-                severity="escalation"
-            )
-            escalated_notification_sent_flag["ldr_bright"] = True
-    else:
-        critical_condition_active_since["ldr_bright"] = 0
-        #if is_unstable_light and (current_time - last_notif_time["ldr"] > NOTIF_DELAY_S["ldr"]):
-        #    send_pushbullet_notification(
-        #        "🌤 Unstable Light Fluctuation",
-        #        f"Erratic light readings detected. Possible reflection from orbital debris or solar panel instability. Run external diagnostics. (LDR: {ldr_value})",
-        #        severity="medium"
-        #    )
-         #   last_notif_time["ldr"] = current_time
-        if is_low_light and (current_time - last_notif_time["ldr"] > NOTIF_DELAY_S["ldr"]):
-            send_pushbullet_notification(
-                "(NORMAL)🌑 Orbital Shadow or Power Anomaly",
-                f"Module entering expected orbital shadow. If this is off-schedule, check primary power bus. Solar arrays show low input. (LDR: {ldr_value})",
-                severity="info" # Low light is less of a warning
-            )
-            last_notif_time["ldr"] = current_time
+    Exits if an ingestion process is already publishing on HAZARD_BUS: two
+    processes reading the same devices would split the readings between them.
+    """
+    global ROLE, bus
+    try:
+        if publish_on_bus:
+            ROLE = "ingest"
+            bus = BusPublisher(BUS_ADDRESS, snapshot=bus_snapshot).start()
+            # Workers may only forget notifications once they are on disk here
+            notification_log.on_evict = lambda seq: bus.publish("notifications_evicted", {"through": seq})
+        elif bus_is_live(BUS_ADDRESS):
+            raise OSError(f"another ingestion process is publishing on {BUS_ADDRESS}")
+    except OSError as e:
+        log.error("Not starting: %s; serve its data with wsgi.py workers instead", e,
+                  extra={"bus": BUS_ADDRESS})
+        raise SystemExit(1)
+    if publish_on_bus:
+        threading.Thread(target=publish_status, name="bus-status", daemon=True).start()
+    notifier.start()
+    history.start()
+    notification_log.start()
+    ingestion.start()
+    # Whatever is still only in memory goes to disk on a clean shutdown
+    atexit.register(notification_log.flush)
+
+def on_bus_message(event, data):
+    global bus_status
+    if event == "reading":
+        sensor_data[data["device"]] = data
+        live_stream.publish("reading", data, device=data["device"])
+    elif event == "notification":
+        notification_log.add(data)
+    elif event == "notifications_evicted":
+        notification_log.evict_through(data["through"])
+    elif event == "status":
+        bus_status = data
+    elif event == "disconnected":
+        bus_status = {}
+        # The ingestion process resends its recent notifications on reconnect
+        notification_log.clear()
+
+def start_web():
+    """Turns this process into a stateless web worker fed by the ingestion process."""
+    global ROLE
+    ROLE = "web"
+    # Only the ingestion process spills notifications to disk; workers read them back
+    # and forget them only once it reports them evicted (notifications_evicted)
+    notification_log.writable = False
+    BusSubscriber(BUS_ADDRESS, on_bus_message).start()
+
+# --- METRICS & PROFILING ---
+# Response time per route, observed for every request this process serves
+http_latency = metrics.Histogram()
+# Off until started with POST /profile/start or --profile
+profiler = SamplingProfiler()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        http_latency.observe(time.perf_counter() - started, route)
+    return response
 
 # --- FLASK ROUTES ---
 @app.route('/')
 def index():
-    return render_template("index.html")
+    # ?device=<name> picks which sector this dashboard shows
+    return render_template("index.html", device=request.args.get("device", DEFAULT_DEVICE))
 
 @app.route('/data')
 def data():
-    data_with_time = sensor_data.copy()
+    device = request.args.get("device", DEFAULT_DEVICE)
+    if device not in DEVICES and device not in sensor_data:
+        return jsonify({"error": f"unknown device {device!r}"}), 404
+    data_with_time = sensor_data.get(device) or {"device": device, "soil": 0, "smoke": 0, "ldr": 0, "flame": 1}
+    data_with_time = dict(data_with_time)
     data_with_time["timestamp"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     return jsonify(data_with_time)
 
-# ——— MAIN ———
-if __name__ == '__main__':
+@app.route('/devices')
+def devices():
+    """Connection status and latest reading for every configured device."""
+    if ROLE == "web":
+        status = {name: dict(d) for name, d in bus_status.get("devices", {}).items()}
+    else:
+        status = ingestion.snapshot()
+    for name in status:
+        status[name]["reading"] = sensor_data.get(name)
+    return jsonify(status)
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events feed of readings, pushed as soon as they are parsed.
+
+    ?device=<name> limits it to one device; without it every device is sent.
+    """
+    return Response(
+        live_stream.subscribe(request.args.get("device") or None),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/history')
+def sensor_history():
+    """Returns stored readings for one sensor, served from the matching rollup level.
+
+    Query args: sensor, from/to (epoch seconds, default the last hour),
+    resolution (raw, 1s, 1m, 1h or auto) and an optional device.
+    """
+    try:
+        end = float(request.args.get("to", time.time()))
+        start = float(request.args.get("from", end - 3600))
+        resolution, points = history.query(
+            request.args.get("sensor", ""),
+            start,
+            end,
+            resolution=request.args.get("resolution", "auto"),
+            device=request.args.get("device"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"resolution": resolution, "from": start, "to": end, "points": points})
+
+@app.route('/notifications')
+def notifications():
+    """Notifications raised after a cursor, oldest first.
+
+    Query args: after (a seq from a previous response's `next`; omit it for
+    the newest `limit` events), severity (one or more, comma-separated),
+    sensor and limit (default 100).
+    """
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-        print(f"✅ Connected to {SERIAL_PORT}")
-    except Exception as e:
-        print(f"❌ Serial error: {e}")
-        ser = None
+        after = request.args.get("after")
+        after = int(after) if after not in (None, "") else None
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers"}), 400
+    severities = [s for s in request.args.get("severity", "").split(",") if s] or None
+    events, next_seq = notification_log.after(after, severities, request.args.get("sensor") or None, limit)
+    return jsonify({"events": events, "next": next_seq})
+
+@app.route('/rules')
+def rules():
+    """The alert rules currently in effect."""
+    return jsonify({"version": rule_engine.version, **rule_engine.ruleset.config})
+
+@app.route('/rules/reload', methods=['POST'])
+def reload_rules():
+    if ROLE == "web":
+        # Only the ingestion process evaluates rules; it reloads rules.json when the file changes
+        return jsonify({"error": "rules are reloaded by the ingestion process when rules.json changes"}), 409
+    if not rule_engine.reload():
+        return jsonify({"error": "rule file is invalid, previous rules kept"}), 400
+    return jsonify({"version": rule_engine.version})
+
+@app.route('/stats')
+def stats():
+    if ROLE == "web":
+        return jsonify({
+            "role": ROLE,
+            "bus_connected": bool(bus_status),
+            "notifier": bus_status.get("notifier"),
+            "history": bus_status.get("history"),
+            "stream": live_stream.snapshot(),
+            "notification_log": notification_log.snapshot(),
+        })
+    return jsonify({
+        "role": ROLE,
+        "notifier": notifier.snapshot(),
+        "stream": live_stream.snapshot(),
+        "history": dict(history.stats),
+        "notification_log": notification_log.snapshot(),
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text format. Ingestion metrics come over the bus on web workers."""
+    if ROLE == "web":
+        status, bus_connected = bus_status, bool(bus_status)
+    else:
+        status, bus_connected = ingestion_status(), None
+    page = metrics.render(status, live_stream.snapshot(), http_latency.snapshot(), logs.snapshot(), bus_connected)
+    return Response(page, content_type=metrics.Exposition.CONTENT_TYPE)
+
+@app.route('/profile')
+def profile():
+    """Stacks sampled so far, in collapsed format for flamegraph.pl or speedscope."""
+    return Response(profiler.collapsed(), mimetype="text/plain",
+                    headers={"X-Profiler-Running": str(int(profiler.running)),
+                             "X-Profiler-Samples": str(profiler.samples)})
+
+@app.route('/profile/start', methods=['POST'])
+def start_profile():
+    try:
+        interval_ms = float(request.args.get("interval_ms", 5))
+    except ValueError:
+        return jsonify({"error": "interval_ms must be a number"}), 400
+    if not (interval_ms > 0 and math.isfinite(interval_ms)):
+        return jsonify({"error": "interval_ms must be greater than 0"}), 400
+    if request.args.get("reset", "1") != "0":
+        profiler.reset()
+    profiler.start(interval_ms / 1000)
+    return jsonify({"running": True, "interval_ms": profiler.interval_s * 1000})
+
+@app.route('/profile/stop', methods=['POST'])
+def stop_profile():
+    profiler.stop()
+    return jsonify({"running": False, "samples": profiler.samples})
+
+def write_profile(path):
+    profiler.stop()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.collapsed())
+    log.info("Wrote profile", extra={"path": path})
 
-    if ser:
-        # (Already started above, but safe to ensure it’s running)
-        threading.Thread(target=read_from_arduino, daemon=True).start()
+# ——— MAIN ———
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hazard monitoring server")
+    parser.add_argument("--ingest", action="store_true",
+                        help="only read the devices and publish on HAZARD_BUS for wsgi.py web workers")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="sample stacks from startup and write them to FILE (collapsed format) on exit")
+    args = parser.parse_args()
+
+    # Exit normally on SIGTERM too, so the atexit hooks (notification log, profile) run
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if args.profile:
+        profiler.start()
+        atexit.register(write_profile, args.profile)
+
+    start_ingestion(publish_on_bus=args.ingest)
+    if args.ingest:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        raise SystemExit(0)
 
     # Run Flask without reloader to avoid duplicate threads
-    app.run(debug=True, use_reloader=False)
+    # threaded so each open /stream connection gets its own worker
+    app.run(debug=True, use_reloader=False, threaded=True)
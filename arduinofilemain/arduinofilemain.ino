@@ -3,7 +3,14 @@ const int soilPin = A0;             // Soil moisture (analog)
 const int smokeSensorPin = A2;      // Smoke sensor (analog)
 const int ldrAnalogPin = A7;        // LDR (analog)
 const int flameDigitalPin = 2;      // Flame sensor (digital)
-     
+
+// --- Output Format ---
+// 0 = one "soil,smoke,ldr,flame" text line per second (original format)
+// 1 = binary frames of SAMPLES_PER_FRAME packed samples at SAMPLE_HZ (see protocol.py)
+#define BINARY_PROTOCOL 0
+const unsigned int SAMPLE_HZ = 50;          // 100 Hz still fits in 9600 baud
+const byte SAMPLES_PER_FRAME = 10;
+const unsigned long SAMPLE_INTERVAL_MS = 1000 / SAMPLE_HZ;
 
 // --- Variables ---
 int soilValue = 0;
@@ -11,18 +18,74 @@ int smokeValue = 0;
 int ldrValue = 0;
 int flameDetected = 0;
 
+#if BINARY_PROTOCOL
+uint32_t frameSamples[SAMPLES_PER_FRAME];
+byte sampleCount = 0;
+uint16_t frameSeq = 0;
+unsigned long nextSampleAt = 0;
+
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), same as binascii.crc_hqx(data, 0xFFFF)
+uint16_t crc16Update(uint16_t crc, byte b) {
+  crc ^= (uint16_t)b << 8;
+  for (byte i = 0; i < 8; i++) {
+    crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+  }
+  return crc;
+}
+
+void writeByte(byte b, uint16_t &crc) {
+  Serial.write(b);
+  crc = crc16Update(crc, b);
+}
+
+void sendFrame() {
+  uint16_t crc = 0xFFFF;
+  Serial.write(0xAA);               // Sync bytes are not covered by the CRC
+  Serial.write(0x55);
+  writeByte(frameSeq & 0xFF, crc);  // Sequence number, little-endian
+  writeByte(frameSeq >> 8, crc);
+  writeByte(sampleCount, crc);
+  writeByte(SAMPLE_INTERVAL_MS, crc);
+  for (byte i = 0; i < sampleCount; i++) {
+    for (byte shift = 0; shift < 32; shift += 8) {
+      writeByte((frameSamples[i] >> shift) & 0xFF, crc);
+    }
+  }
+  Serial.write(crc & 0xFF);
+  Serial.write(crc >> 8);
+  frameSeq++;
+  sampleCount = 0;
+}
+#endif
+
 void setup() {
   Serial.begin(9600);               // Start Serial Monitor
   pinMode(flameDigitalPin, INPUT);  // Set flame pin as input
 }
 
 void loop() {
+#if BINARY_PROTOCOL
+  unsigned long now = millis();
+  if ((long)(now - nextSampleAt) < 0) return;
+  nextSampleAt = now + SAMPLE_INTERVAL_MS;
+#endif
+
   // Read sensor values
   soilValue = analogRead(soilPin);            // 0–1023
   smokeValue = analogRead(smokeSensorPin);    // 0–1023
   ldrValue = analogRead(ldrAnalogPin);        // 0–1023
   flameDetected = digitalRead(flameDigitalPin);// 0 = flame, 1 = no flame
 
+#if BINARY_PROTOCOL
+  // Pack 3 x 10-bit readings and the flame bit into 4 bytes
+  frameSamples[sampleCount++] = (uint32_t)soilValue
+                              | ((uint32_t)smokeValue << 10)
+                              | ((uint32_t)ldrValue << 20)
+                              | ((uint32_t)(flameDetected & 1) << 30);
+  if (sampleCount == SAMPLES_PER_FRAME) {
+    sendFrame();
+  }
+#else
   // Send comma-separated values over serial (for Python to read)
   Serial.print(soilValue);
   Serial.print(",");
@@ -33,4 +96,5 @@ void loop() {
   Serial.println(flameDetected);
 
   delay(1000);
+#endif
 }
@@ -0,0 +1,178 @@
+import errno
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+log = logging.getLogger("hazard.bus")
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:5701" if os.name == "nt" else "unix:///tmp/hazard-bus.sock"
+
+
+def _family_and_address(address):
+    """Parses "unix:///path" (or a bare path) and "tcp://host:port" bus addresses."""
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return socket.AF_INET, (host, int(port))
+    if address.startswith("unix://"):
+        address = address[len("unix://"):]
+    return socket.AF_UNIX, address
+
+
+def bus_is_live(address, timeout_s=1.0):
+    """True if a BusPublisher is already accepting connections on `address`."""
+    family, addr = _family_and_address(address)
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout_s)
+            sock.connect(addr)
+        return True
+    except OSError:
+        return False
+
+
+def encode(event, data):
+    return json.dumps({"event": event, "data": data}).encode("utf-8") + b"\n"
+
+
+class BusPublisher:
+    """Local pub/sub server run by the process that owns the serial devices.
+
+    Messages are newline-delimited JSON, serialized once per publish. Each
+    subscriber has a bounded queue and its own sender thread. A subscriber
+    that falls a whole queue behind is disconnected rather than allowed to
+    slow down ingestion or silently miss messages; it resyncs from the
+    snapshot when it reconnects. New subscribers first receive `snapshot()`,
+    a list of (event, data) pairs describing the current state.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, snapshot=None, client_queue_size=1024):
+        self.address = address
+        self.snapshot = snapshot
+        self.client_queue_size = client_queue_size
+        # queue -> socket of every connected subscriber
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._sock = None
+        self.stats = {"published": 0, "slow_disconnects": 0, "subscribers": 0}
+
+    def start(self):
+        family, addr = _family_and_address(self.address)
+        # Only one process may own the devices; never take the address over from a live one
+        if bus_is_live(self.address):
+            raise OSError(errno.EADDRINUSE, f"another ingestion process is publishing on {self.address}")
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            # Nobody answered, so this is a socket file left behind by a crashed run
+            if os.path.exists(addr):
+                os.unlink(addr)
+        elif os.name == "nt":
+            # On Windows SO_REUSEADDR would let a second process bind the same port
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(addr)
+            sock.listen(64)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        threading.Thread(target=self._accept, name="bus-accept", daemon=True).start()
+        log.info("Publishing readings on the bus", extra={"address": self.address})
+        return self
+
+    def publish(self, event, data):
+        frame = encode(event, data)
+        with self._lock:
+            clients = list(self._clients.items())
+            self.stats["published"] += 1
+        slow = []
+        for q, conn in clients:
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                slow.append((q, conn))
+        if slow:
+            with self._lock:
+                for q, _ in slow:
+                    self._clients.pop(q, None)
+                self.stats["slow_disconnects"] += len(slow)
+                self.stats["subscribers"] = len(self._clients)
+            for _, conn in slow:
+                # Missing a message would leave a hole (e.g. in the notification seqs);
+                # dropping the link makes the worker start over from a fresh snapshot
+                log.warning("Bus subscriber fell behind, disconnecting it")
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _accept(self):
+        while True:
+            conn, _ = self._sock.accept()
+            threading.Thread(target=self._serve, args=(conn,), name="bus-client", daemon=True).start()
+
+    def _serve(self, conn):
+        q = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            # Register before taking the snapshot so nothing falls in between
+            self._clients[q] = conn
+            self.stats["subscribers"] = len(self._clients)
+        try:
+            initial = self.snapshot() if self.snapshot else []
+            conn.sendall(b"".join(encode(event, data) for event, data in initial))
+            while True:
+                conn.sendall(q.get())
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._clients.pop(q, None)
+                self.stats["subscribers"] = len(self._clients)
+            conn.close()
+
+
+class BusSubscriber:
+    """Follows a BusPublisher from a web worker and calls `on_message(event, data)`.
+
+    Reconnects with backoff if the ingestion process restarts; `on_message`
+    receives ("disconnected", None) each time the link drops.
+    """
+
+    def __init__(self, address, on_message):
+        self.address = address
+        self.on_message = on_message
+        self.connected = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bus-subscriber", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        family, addr = _family_and_address(self.address)
+        backoff = 0.5
+        while True:
+            try:
+                with socket.socket(family, socket.SOCK_STREAM) as sock:
+                    sock.connect(addr)
+                    self.connected = True
+                    backoff = 0.5
+                    with sock.makefile("rb") as stream:
+                        for line in stream:
+                            msg = json.loads(line)
+                            self.on_message(msg["event"], msg["data"])
+            except (OSError, ValueError) as e:
+                if self.connected:
+                    log.warning("Lost the ingestion bus: %s", e, extra={"address": self.address})
+            if self.connected:
+                self.connected = False
+                self.on_message("disconnected", None)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 10)
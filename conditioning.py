@@ -0,0 +1,243 @@
+import numpy as np
+
+SENSORS = ("soil", "smoke", "ldr", "flame")
+FEATURES = ("mean", "median", "ewma", "std", "z", "slope")
+
+
+class SignalConditioner:
+    """Rolling statistics for every sensor of one device, on a fixed-size ring buffer.
+
+    Each `update` costs O(1) whatever the window length: mean, standard
+    deviation and the least-squares slope come from running sums, and EWMA is
+    a single recurrence. The median looks only at the last `median_window`
+    samples. Memory per sensor is fixed at `window` samples, whatever the
+    sample rate.
+
+    Features per sensor (exposed to rules as "<sensor>.<feature>"):
+      mean    moving average over the window
+      median  median of the last `median_window` samples (spike rejection)
+      ewma    exponentially weighted moving average
+      std     moving standard deviation
+      z       z-score of the newest sample against the window before it
+      slope   rate of change in units per second, least squares over the window
+    """
+
+    def __init__(self, window=16, median_window=3, alpha=0.3, sensors=SENSORS):
+        if not 1 <= median_window <= window:
+            raise ValueError("median_window must be between 1 and window")
+        self.window = window
+        self.median_window = median_window
+        self.alpha = alpha
+        self.sensors = sensors
+        n = len(sensors)
+        self.values = np.zeros((n, window))
+        self.times = np.zeros(window)
+        self.pos = 0
+        self.count = 0
+        self.ewma = np.zeros(n)
+        # Running sums over the window; times are relative to t_ref to keep precision
+        self.t_ref = 0.0
+        self.sum_y = np.zeros(n)
+        self.sum_yy = np.zeros(n)
+        self.sum_ty = np.zeros(n)
+        self.sum_t = 0.0
+        self.sum_tt = 0.0
+        self._keys = [(s, [f"{s}.{f}" for f in FEATURES]) for s in sensors]
+
+    def _resum(self):
+        """Recomputes the running sums exactly, once per lap of the ring, to stop float drift."""
+        n = self.count
+        if n == self.window:
+            y, t = self.values, self.times
+        else:
+            y, t = self.values[:, :n], self.times[:n]
+        self.t_ref = float(t.min()) if n else 0.0
+        rel = t - self.t_ref
+        self.sum_y = y.sum(axis=1)
+        self.sum_yy = (y * y).sum(axis=1)
+        self.sum_ty = (y * rel).sum(axis=1)
+        self.sum_t = float(rel.sum())
+        self.sum_tt = float((rel * rel).sum())
+
+    def update(self, ts, sample):
+        """Adds one (soil, smoke, ldr, flame) sample and returns the conditioned signals.
+
+        The result maps each sensor to its raw value and "<sensor>.<feature>"
+        to each feature, ready to be evaluated by the rule engine.
+        """
+        x = np.asarray(sample, dtype=float)
+        n = self.count
+
+        # z-score against the window as it was before this sample
+        if n >= 2:
+            mean_prev = self.sum_y / n
+            var_prev = np.maximum(self.sum_yy / n - mean_prev * mean_prev, 0.0)
+            # A flat window (std 0) gives z = 0 rather than a division error
+            std_prev = np.sqrt(var_prev)
+            std_prev[std_prev == 0] = np.inf
+            z = (x - mean_prev) / std_prev
+        else:
+            z = np.zeros_like(x)
+
+        pos = self.pos
+        if n == self.window:
+            # Slide: remove the sample being overwritten from the sums
+            old_y = self.values[:, pos]
+            old_t = self.times[pos] - self.t_ref
+            self.sum_y -= old_y
+            self.sum_yy -= old_y * old_y
+            self.sum_ty -= old_y * old_t
+            self.sum_t -= old_t
+            self.sum_tt -= old_t * old_t
+        else:
+            self.count = n = n + 1
+        if n == 1:
+            self.t_ref = ts
+            self.ewma = x.copy()
+        else:
+            self.ewma += self.alpha * (x - self.ewma)
+
+        self.values[:, pos] = x
+        self.times[pos] = ts
+        rel = ts - self.t_ref
+        self.sum_y += x
+        self.sum_yy += x * x
+        self.sum_ty += x * rel
+        self.sum_t += rel
+        self.sum_tt += rel * rel
+        self.pos = (pos + 1) % self.window
+        if self.pos == 0:
+            self._resum()
+
+        mean = self.sum_y / n
+        std = np.sqrt(np.maximum(self.sum_yy / n - mean * mean, 0.0))
+        denom = n * self.sum_tt - self.sum_t * self.sum_t
+        if n >= 2 and denom > 1e-12:
+            slope = (n * self.sum_ty - self.sum_t * self.sum_y) / denom
+        else:
+            slope = np.zeros_like(x)
+        m = min(n, self.median_window)
+        end = self.pos or self.window
+        if end >= m:
+            recent = np.sort(self.values[:, end - m:end], axis=1)
+        else:
+            recent = np.sort(np.take(self.values, range(end - m, end), axis=1, mode="wrap"), axis=1)
+        half = m // 2
+        median = recent[:, half] if m % 2 else (recent[:, half - 1] + recent[:, half]) / 2
+
+        out = {}
+        columns = zip(sample, mean.tolist(), median.tolist(), self.ewma.tolist(),
+                      std.tolist(), z.tolist(), slope.tolist())
+        for (sensor, keys), (raw, *features) in zip(self._keys, columns):
+            out[sensor] = raw
+            out.update(zip(keys, features))
+        return out
+
+    def condition_batch(self, times, samples):
+        """Conditions a whole recording at once, e.g. rows replayed from the history store.
+
+        `times` has shape (N,), `samples` (N, n_sensors). Returns a dict of
+        feature -> array of shape (N, n_sensors), matching what N calls to
+        `update` on a fresh conditioner would produce. Does not touch the
+        streaming state.
+        """
+        t = np.asarray(times, dtype=float)
+        y = np.asarray(samples, dtype=float)
+        count = len(t)
+        w = self.window
+        idx = np.arange(count)
+        n = np.minimum(idx + 1, w)[:, None]
+
+        def window_sum(a):
+            # Sum over the trailing window ending at each row, via one cumulative sum
+            c = np.cumsum(a, axis=0)
+            c[w:] = c[w:] - c[:-w]
+            return c
+
+        sum_y = window_sum(y)
+        sum_yy = window_sum(y * y)
+        mean = sum_y / n
+        std = np.sqrt(np.maximum(sum_yy / n - mean * mean, 0.0))
+        # Epoch seconds squared lose precision; work relative to the first sample
+        slope = _rolling_slope(t - t[0] if count else t, y, w)
+
+        # z-score uses the statistics of the window ending one row earlier
+        z = np.zeros_like(y)
+        if count > 1:
+            prev_n = n[:-1]
+            prev_mean, prev_std = mean[:-1], std[:-1]
+            ok = (prev_n >= 2) & (prev_std > 0)
+            z[1:] = np.divide(y[1:] - prev_mean, prev_std, out=np.zeros_like(y[1:]), where=ok)
+
+        median = np.empty_like(y)
+        m = self.median_window
+        for k in range(min(m - 1, count)):
+            median[k] = np.median(y[:k + 1], axis=0)
+        if count >= m:
+            windows = np.lib.stride_tricks.sliding_window_view(y, m, axis=0)
+            median[m - 1:] = np.median(windows, axis=-1)
+
+        return {"mean": mean, "median": median, "ewma": _ewma(y, self.alpha),
+                "std": std, "z": z, "slope": slope}
+
+    def signals_batch(self, times, samples):
+        """`condition_batch` as one signals dict per row, shaped like `update`'s result."""
+        batch = self.condition_batch(times, samples)
+        columns = [batch[feature].tolist() for feature in FEATURES]
+        rows = []
+        for i, sample in enumerate(samples):
+            signals = {}
+            for j, (sensor, keys) in enumerate(self._keys):
+                signals[sensor] = sample[j]
+                signals.update(zip(keys, [column[i][j] for column in columns]))
+            rows.append(signals)
+        return rows
+
+
+def _slope(t, y):
+    """Least-squares slope of y (..., S, k) against t (..., k), times centred per window."""
+    tc = t - t.mean(axis=-1, keepdims=True)
+    denom = (tc * tc).sum(axis=-1)
+    num = (tc[..., None, :] * y).sum(axis=-1)
+    denom = np.broadcast_to(denom[..., None], num.shape)
+    return np.divide(num, denom, out=np.zeros_like(num), where=denom > 1e-12)
+
+
+def _rolling_slope(t, y, w):
+    out = np.zeros_like(y)
+    count = len(t)
+    for k in range(1, min(w - 1, count)):
+        out[k] = _slope(t[:k + 1], y[:k + 1].T)
+    if count >= w and w >= 2:
+        tw = np.lib.stride_tricks.sliding_window_view(t, w)
+        yw = np.lib.stride_tricks.sliding_window_view(y, w, axis=0)
+        out[w - 1:] = _slope(tw, yw)
+    return out
+
+
+def _ewma(y, alpha):
+    """Vectorized EWMA seeded with the first row, computed in chunks to avoid overflow."""
+    out = np.empty_like(y)
+    if not len(y):
+        return out
+    decay = 1.0 - alpha
+    # (1 - alpha) ** -chunk must stay well inside float64 range
+    chunk = max(1, int(600 / -np.log(decay))) if 0 < decay < 1 else len(y)
+    prev = y[0]
+    start = 0
+    while start < len(y):
+        block = y[start:start + chunk]
+        k = np.arange(len(block))[:, None]
+        if start == 0:
+            # First output is the first sample itself
+            weights = decay ** -k
+            weights[0] = 1.0 / alpha
+            acc = np.cumsum(alpha * block * weights, axis=0)
+            out[:len(block)] = acc * decay ** k
+        else:
+            weights = decay ** -(k + 1)
+            acc = np.cumsum(alpha * block * weights, axis=0)
+            out[start:start + len(block)] = (prev + acc) * decay ** (k + 1)
+        prev = out[start + len(block) - 1]
+        start += len(block)
+    return out
@@ -0,0 +1,326 @@
+import bisect
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("hazard.events")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    seq INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    device TEXT, sensor TEXT, severity TEXT,
+    title TEXT, body TEXT,
+    undelivered INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS notifications_severity_seq ON notifications (severity, seq);
+CREATE INDEX IF NOT EXISTS notifications_sensor_seq ON notifications (sensor, seq);
+CREATE INDEX IF NOT EXISTS notifications_ts ON notifications (ts);
+"""
+
+COLUMNS = ("seq", "ts", "device", "sensor", "severity", "title", "body", "undelivered")
+
+
+class _Index:
+    """Events in ascending seq order, trimmed from the front without shifting the list each time."""
+
+    def __init__(self):
+        self.seqs = []
+        self.events = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.seqs) - self.start
+
+    def append(self, event):
+        self.seqs.append(event["seq"])
+        self.events.append(event)
+
+    def trim_through(self, seq):
+        self.start = bisect.bisect_right(self.seqs, seq, self.start)
+        # Compact once the dead prefix outgrows the live part: amortized O(1) per event
+        if self.start > len(self.seqs) // 2:
+            del self.seqs[:self.start]
+            del self.events[:self.start]
+            self.start = 0
+
+    def after(self, seq, limit):
+        i = bisect.bisect_right(self.seqs, seq, self.start)
+        return self.events[i:i + limit]
+
+    def tail(self, limit):
+        return self.events[max(self.start, len(self.events) - limit):]
+
+    def first(self):
+        return self.seqs[self.start]
+
+
+class EventLog:
+    """Notification history with cursor-based reads, for the dashboard's /notifications feed.
+
+    Every event gets the next sequence number and is kept in memory, indexed
+    by severity and by sensor. A background writer (`start()`) spills new
+    events to SQLite every `flush_interval_s`, or sooner once `spill_batch`
+    are waiting, and prunes rows older than `retention_s` every
+    `prune_interval_s`. Only events already on disk are evicted, down to the
+    newest `memory_events`, so a failed spill is retried rather than leaving
+    a gap. Beyond `max_memory_events` the oldest are dropped and counted as
+    lost. Reading everything after a cursor costs O(log n + new events),
+    however long the log is.
+
+    With `writable=False` (web workers) events come with their seq already
+    set and nothing is spilled. Workers evict through `evict_through()`, when
+    the ingestion process reports what it evicted, and read older cursors
+    from the database the ingestion process writes.
+    """
+
+    def __init__(self, path, memory_events=1000, spill_batch=100, retention_s=30 * 86400, writable=True,
+                 flush_interval_s=1.0, prune_interval_s=3600, max_memory_events=100000):
+        self.path = path
+        self.memory_events = memory_events
+        self.spill_batch = spill_batch
+        self.retention_s = retention_s
+        self.writable = writable
+        self.flush_interval_s = flush_interval_s
+        self.prune_interval_s = prune_interval_s
+        self.max_memory_events = max_memory_events
+        # Called with the last evicted seq after the writer evicts, e.g. to tell web workers
+        self.on_evict = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._local = threading.local()
+        self._all = _Index()
+        self._by_severity = {}
+        self._by_sensor = {}
+        self.stats = {"appended": 0, "spilled": 0, "spill_errors": 0, "lost": 0, "pruned": 0}
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        _add_undelivered_column(conn)
+        conn.commit()
+        # Carry on from the last spilled event so cursors stay valid across restarts
+        self.last_seq = self._spilled_through = self._last_on_disk()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _last_on_disk(self):
+        return self._connect().execute("SELECT COALESCE(MAX(seq), 0) FROM notifications").fetchone()[0]
+
+    def start(self):
+        """Starts the background writer (ingestion process only)."""
+        if self._thread is None and self.writable:
+            self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, title, body, severity="info", device=None, sensor=None, ts=None, undelivered=False):
+        """Records one notification and returns it, with its seq, as a dict.
+
+        `undelivered` marks an alert that was raised but could not be queued for a push.
+        """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self.last_seq += 1
+            event = {"seq": self.last_seq, "ts": ts, "device": device, "sensor": sensor,
+                     "severity": severity, "title": title, "body": body, "undelivered": undelivered}
+            self._add(event)
+        return event
+
+    def add(self, event):
+        """Adds an event that already has a seq (from the bus); older or repeated ones are ignored."""
+        with self._lock:
+            if event["seq"] <= self.last_seq:
+                return False
+            self.last_seq = event["seq"]
+            self._add(event)
+        return True
+
+    def clear(self):
+        """Forgets the in-memory events, e.g. before a web worker resyncs from the bus."""
+        with self._lock:
+            self._all = _Index()
+            self._by_severity = {}
+            self._by_sensor = {}
+            self.last_seq = self._last_on_disk()
+
+    def evict_through(self, seq):
+        """Drops in-memory events up to `seq`, once the ingestion process has them on disk."""
+        with self._lock:
+            if len(self._all) and self._all.first() <= seq:
+                self._evict_through(seq)
+
+    def _add(self, event):
+        self._all.append(event)
+        self._by_severity.setdefault(event["severity"], _Index()).append(event)
+        self._by_sensor.setdefault(event["sensor"], _Index()).append(event)
+        self.stats["appended"] += 1
+        if self.writable and event["seq"] - self._spilled_through >= self.spill_batch:
+            self._wake.set()
+        if len(self._all) > self.max_memory_events:
+            # The disk has been failing for a long time; something has to give
+            through = self._all.seqs[self._all.start + len(self._all) - self.max_memory_events - 1]
+            if self.writable:
+                self.stats["lost"] += max(0, through - self._spilled_through)
+                self._spilled_through = max(self._spilled_through, through)
+            self._evict_through(through)
+
+    def _evict_through(self, through):
+        self._all.trim_through(through)
+        for indexes in (self._by_severity, self._by_sensor):
+            for key, index in list(indexes.items()):
+                index.trim_through(through)
+                if not len(index):
+                    del indexes[key]
+
+    def _run(self):
+        failures = 0
+        next_prune = 0.0
+        while True:
+            if failures:
+                # The database is unavailable: back off, events wait in memory meanwhile
+                time.sleep(min(self.flush_interval_s * 2 ** failures, 30.0))
+            else:
+                self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            if not self._spill():
+                failures += 1
+                continue
+            failures = 0
+            if self.retention_s and time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + self.prune_interval_s
+                self._prune()
+
+    def _spill(self):
+        """Writes every event not yet on disk, then evicts down to `memory_events`. Returns False on failure."""
+        with self._write_lock:
+            with self._lock:
+                events = self._all.after(self._spilled_through, len(self._all))
+            if events:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany(
+                            f"INSERT OR REPLACE INTO notifications ({', '.join(COLUMNS)})"
+                            f" VALUES ({', '.join('?' * len(COLUMNS))})",
+                            [tuple(e[c] for c in COLUMNS) for e in events],
+                        )
+                except sqlite3.Error as e:
+                    self.stats["spill_errors"] += 1
+                    log.error("Could not spill notifications to disk: %s", e, extra={"events": len(events)})
+                    return False
+            with self._lock:
+                if events:
+                    self._spilled_through = max(self._spilled_through, events[-1]["seq"])
+                    self.stats["spilled"] += len(events)
+                excess = len(self._all) - self.memory_events
+                through = None
+                if excess > 0:
+                    through = min(self._all.seqs[self._all.start + excess - 1], self._spilled_through)
+                    self._evict_through(through)
+        if through is not None and self.on_evict is not None:
+            self.on_evict(through)
+        return True
+
+    def _prune(self):
+        try:
+            with self._connect() as conn:
+                pruned = conn.execute("DELETE FROM notifications WHERE ts < ?",
+                                      (time.time() - self.retention_s,)).rowcount
+            self.stats["pruned"] += pruned
+        except sqlite3.Error as e:
+            log.error("Could not prune old notifications: %s", e)
+
+    def flush(self):
+        """Writes every event not yet on disk now, e.g. on shutdown."""
+        if self.writable:
+            self._spill()
+
+    def after(self, seq=None, severities=None, sensor=None, limit=100):
+        """Returns (events, next_seq): events with seq > `seq`, oldest first.
+
+        With no `seq`, returns the newest `limit` events. `next_seq` is the
+        cursor for the following call: the last event returned when the page
+        is full, otherwise the newest seq in the log. A `next_seq` below `seq`
+        means the log was reset and the caller should start over.
+        """
+        with self._lock:
+            latest = self.last_seq
+            first_in_memory = self._all.first() if len(self._all) else latest + 1
+            indexes = self._pick(severities, sensor)
+            if seq is None:
+                events = list(heapq.merge(*(index.tail(limit) for index in indexes), key=_seq))[-limit:]
+                return [e for e in events if _matches(e, severities, sensor)], latest
+            memory = list(heapq.merge(*(index.after(seq, limit) for index in indexes), key=_seq))
+
+        events = []
+        if seq + 1 < first_in_memory:
+            events = self._from_disk(seq, first_in_memory, severities, sensor, limit)
+        events += [e for e in memory if _matches(e, severities, sensor)]
+        events = events[:limit]
+        if len(events) == limit:
+            return events, events[-1]["seq"]
+        return events, latest
+
+    def tail(self, limit=None):
+        """The newest `limit` events in memory, or all of them."""
+        with self._lock:
+            return list(self._all.tail(len(self._all) if limit is None else limit))
+
+    def _pick(self, severities, sensor):
+        if sensor is not None:
+            index = self._by_sensor.get(sensor)
+            return [index] if index else []
+        if severities:
+            return [self._by_severity[s] for s in severities if s in self._by_severity]
+        return [self._all]
+
+    def _from_disk(self, seq, before, severities, sensor, limit):
+        where, args = ["seq > ?", "seq < ?"], [seq, before]
+        if severities:
+            where.append(f"severity IN ({','.join('?' * len(severities))})")
+            args += severities
+        if sensor is not None:
+            where.append("sensor = ?")
+            args.append(sensor)
+        rows = self._connect().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM notifications WHERE {' AND '.join(where)} ORDER BY seq LIMIT ?",
+            args + [limit],
+        ).fetchall()
+        events = [dict(zip(COLUMNS, row)) for row in rows]
+        for event in events:
+            event["undelivered"] = bool(event["undelivered"])
+        return events
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, in_memory=len(self._all), last_seq=self.last_seq,
+                        unspilled=self.last_seq - self._spilled_through if self.writable else 0)
+
+
+def _add_undelivered_column(conn):
+    """Upgrades a notifications table created before alerts could be marked undelivered."""
+    if "undelivered" in {row[1] for row in conn.execute("PRAGMA table_info(notifications)")}:
+        return
+    try:
+        conn.execute("ALTER TABLE notifications ADD COLUMN undelivered INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        # Another process (a web worker starting alongside) added it first
+        pass
+
+
+def _seq(event):
+    return event["seq"]
+
+
+def _matches(event, severities, sensor):
+    return (not severities or event["severity"] in severities) and (sensor is None or event["sensor"] == sensor)
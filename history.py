@@ -0,0 +1,201 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+log = logging.getLogger("hazard.history")
+
+SENSORS = ("soil", "smoke", "ldr", "flame")
+
+# Rollup levels kept up to date on every write: name -> bucket width in seconds
+RESOLUTIONS = {"1s": 1, "1m": 60, "1h": 3600}
+
+# How long each level is kept; None keeps it forever
+RETENTION_S = {"raw": 7 * 86400, "1s": 2 * 86400, "1m": 90 * 86400, "1h": None}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    ts REAL NOT NULL,
+    device TEXT NOT NULL,
+    soil INTEGER, smoke INTEGER, ldr INTEGER, flame INTEGER
+);
+CREATE INDEX IF NOT EXISTS readings_device_ts ON readings (device, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    sensor TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    min REAL, max REAL, sum REAL, count INTEGER,
+    PRIMARY KEY (resolution, device, sensor, bucket)
+) WITHOUT ROWID;
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (resolution, device, sensor, bucket, min, max, sum, count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, device, sensor, bucket) DO UPDATE SET
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    sum = sum + excluded.sum,
+    count = count + excluded.count
+"""
+
+
+class HistoryStore:
+    """Persists readings to SQLite (WAL mode) with incrementally maintained rollups.
+
+    `append` only enqueues; a writer thread commits readings in batches and
+    folds each batch into the 1 s / 1 min / 1 h min-max-mean tables, so history
+    queries read a handful of pre-aggregated rows instead of scanning raw data.
+    """
+
+    def __init__(self, path="history.db", flush_interval_s=1.0, batch_size=500, max_queue=10000):
+        self.path = path
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._thread = None
+        self.stats = {"written": 0, "dropped": 0, "batches": 0}
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # sqlite3 connections are per-thread; each request thread keeps its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, device, ts, reading):
+        """Queues one reading for the next batch without blocking."""
+        try:
+            self._queue.put_nowait((ts, device, reading["soil"], reading["smoke"],
+                                    reading["ldr"], reading["flame"]))
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _writer(self):
+        conn = self._connect()
+        last_prune = 0
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(conn, batch)
+                if time.time() - last_prune > 3600:
+                    self._prune(conn)
+                    last_prune = time.time()
+            except sqlite3.Error as e:
+                log.error("Error writing sensor history: %s", e, extra={"batch": len(batch)})
+
+    def _write_batch(self, conn, batch):
+        # Pre-aggregate in memory so each touched bucket costs one upsert
+        acc = defaultdict(lambda: [float("inf"), float("-inf"), 0.0, 0])
+        for row in batch:
+            ts, device = row[0], row[1]
+            for sensor, value in zip(SENSORS, row[2:]):
+                for width in RESOLUTIONS.values():
+                    a = acc[(width, device, sensor, int(ts // width) * width)]
+                    if value < a[0]:
+                        a[0] = value
+                    if value > a[1]:
+                        a[1] = value
+                    a[2] += value
+                    a[3] += 1
+
+        with conn:
+            conn.executemany(
+                "INSERT INTO readings (ts, device, soil, smoke, ldr, flame) VALUES (?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            conn.executemany(UPSERT_ROLLUP, [key + tuple(a) for key, a in acc.items()])
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+
+    def _prune(self, conn):
+        now = time.time()
+        with conn:
+            if RETENTION_S["raw"]:
+                conn.execute("DELETE FROM readings WHERE ts < ?", (now - RETENTION_S["raw"],))
+            for name, width in RESOLUTIONS.items():
+                if RETENTION_S[name]:
+                    conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?",
+                                 (width, now - RETENTION_S[name]))
+
+    def readings(self, device, start, end):
+        """Raw rows for one device as (timestamps, [[soil, smoke, ldr, flame], ...]).
+
+        The shape SignalConditioner.condition_batch expects, for replaying stored data.
+        """
+        rows = self._reader().execute(
+            "SELECT ts, soil, smoke, ldr, flame FROM readings"
+            " WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+            (device, start, end),
+        ).fetchall()
+        return [row[0] for row in rows], [row[1:] for row in rows]
+
+    @staticmethod
+    def pick_resolution(start, end, max_points=1000):
+        """Finest rollup level that keeps the result under `max_points` rows."""
+        for name, width in RESOLUTIONS.items():
+            if (end - start) / width <= max_points:
+                return name
+        return list(RESOLUTIONS)[-1]
+
+    def query(self, sensor, start, end, resolution="auto", device=None):
+        """Returns points for `sensor` between `start` and `end` (epoch seconds)."""
+        if sensor not in SENSORS:
+            raise ValueError(f"unknown sensor {sensor!r}")
+        if resolution == "auto":
+            resolution = self.pick_resolution(start, end)
+        conn = self._reader()
+
+        device_clause = " AND device = ?" if device else ""
+        device_args = (device,) if device else ()
+
+        if resolution == "raw":
+            # sensor is validated against SENSORS above, so the column name is safe
+            rows = conn.execute(
+                f"SELECT ts, {sensor} FROM readings WHERE ts >= ? AND ts <= ?{device_clause} ORDER BY ts",
+                (start, end) + device_args,
+            ).fetchall()
+            return resolution, [{"t": ts, "value": value} for ts, value in rows]
+
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"unknown resolution {resolution!r}")
+        width = RESOLUTIONS[resolution]
+        rows = conn.execute(
+            "SELECT bucket, MIN(min), MAX(max), SUM(sum), SUM(count) FROM rollups"
+            f" WHERE resolution = ? AND sensor = ? AND bucket >= ? AND bucket <= ?{device_clause}"
+            " GROUP BY bucket ORDER BY bucket",
+            (width, sensor, int(start // width) * width, end) + device_args,
+        ).fetchall()
+        return resolution, [
+            {"t": bucket, "min": lo, "max": hi, "mean": total / count}
+            for bucket, lo, hi, total, count in rows
+        ]
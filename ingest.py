@@ -0,0 +1,366 @@
+import errno
+import io
+import os
+import logging
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from metrics import Histogram
+from protocol import SYNC, FrameDecoder, parse_csv_line
+
+log = logging.getLogger("hazard.ingest")
+
+RECONNECT_MIN_S = 1
+RECONNECT_MAX_S = 30
+CONNECT_TIMEOUT_S = 5
+MAX_LINE_BYTES = 4096
+# getaddrinfo blocks for as long as DNS takes, so bridge hostnames are looked up here, off the loop
+_resolver = ThreadPoolExecutor(max_workers=4, thread_name_prefix="resolve")
+# How long a port keeps looking for a valid binary frame after a stray 0xAA before staying on CSV
+BINARY_PROBE_BYTES = 4096
+
+
+def parse_devices(spec, default_port):
+    """Parses "name=port,name=port" into an ordered {name: port} dict.
+
+    A port is a serial device (COM5, /dev/ttyUSB0) or a TCP serial bridge
+    written as tcp://host:port. A bare port uses itself as the device name.
+    """
+    if not spec:
+        return {default_port: default_port}
+    devices = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, port = entry.partition("=")
+        if not port:
+            name, port = entry, entry
+        devices[name.strip()] = port.strip()
+    return devices
+
+
+class Device:
+    """One serial port or TCP serial bridge, with its own receive buffer and reconnect backoff.
+
+    A port starts out speaking CSV. A sync byte starts a probe decoder next to
+    the CSV parser, and the port switches to binary only once a whole frame
+    passes its CRC; a probe that finds none within BINARY_PROBE_BYTES is
+    dropped as line noise (see protocol.py).
+    """
+
+    def __init__(self, name, port, baud_rate):
+        self.name = name
+        self.port = port
+        self.baud_rate = baud_rate
+        # Seconds per byte on the wire (8N1: ten bits per byte). A TCP bridge
+        # delivers in bursts at network speed, so its bytes carry no such delay
+        self.byte_s = 0.0 if self.is_tcp else 10 / baud_rate
+        # Bytes still queued in the driver after the last read
+        self.backlog = 0
+        self.conn = None
+        self.buffer = bytearray()
+        self.decoder = None
+        self.probe = None
+        self.probe_bytes = 0
+        self.retry_at = 0.0
+        self.backoff_s = RECONNECT_MIN_S
+        # A TCP bridge stays "connecting" until the engine sees the socket turn writable
+        self.connecting = False
+        self.connect_deadline = 0.0
+        # Pending (or finished) address lookup for a TCP bridge, see resolve()
+        self._lookup = None
+        self.ever_connected = False
+        self.stats = {"connected": False, "protocol": "csv", "lines": 0, "readings": 0, "parse_errors": 0,
+                      "bytes": 0, "reconnects": 0, "overruns": 0, "false_syncs": 0}
+
+    @property
+    def is_tcp(self):
+        return self.port.startswith("tcp://")
+
+    def resolve(self):
+        """Starts looking up a TCP bridge's address on a helper thread; True once the result is in.
+
+        Serial ports need no lookup. The engine only calls open() once this is True.
+        """
+        if not self.is_tcp:
+            return True
+        if self._lookup is None:
+            host, _, port = self.port[len("tcp://"):].rpartition(":")
+            self._lookup = _resolver.submit(socket.getaddrinfo, host, int(port), type=socket.SOCK_STREAM)
+        return self._lookup.done()
+
+    def open(self):
+        if self.is_tcp:
+            self.resolve()
+            # Looked up afresh on every reconnect, in case the bridge's address changed
+            lookup, self._lookup = self._lookup, None
+            family, kind, proto, _, address = lookup.result()[0]
+            conn = socket.socket(family, kind, proto)
+            # Never wait for the handshake here: the engine finishes it from its select loop
+            conn.setblocking(False)
+            err = conn.connect_ex(address)
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", None)):
+                conn.close()
+                raise OSError(err, os.strerror(err))
+            self.conn = conn
+            self.connecting = True
+            self.connect_deadline = time.monotonic() + CONNECT_TIMEOUT_S
+            return
+        # timeout=0 makes reads non-blocking so one thread can serve every port;
+        # exclusive locks the port so a second server can't steal half the bytes
+        self.conn = serial.Serial(self.port, self.baud_rate, timeout=0, exclusive=True)
+        self.opened()
+
+    def finish_connect(self):
+        """Completes a pending TCP connect once the socket is writable; raises if it failed."""
+        err = self.conn.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise OSError(err, os.strerror(err))
+        self.connecting = False
+        self.opened()
+
+    def opened(self):
+        self.buffer.clear()
+        self.decoder = None
+        self.probe = None
+        self.backlog = 0
+        self.stats["protocol"] = "csv"
+        self.backoff_s = RECONNECT_MIN_S
+        self.stats["connected"] = True
+
+    def fileno(self):
+        """Selectable descriptor, or None where the platform has none (Windows COM ports)."""
+        try:
+            return self.conn.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return None
+
+    def read(self):
+        if self.is_tcp:
+            try:
+                chunk = self.conn.recv(4096)
+            except BlockingIOError:
+                return b""
+            if not chunk:
+                raise ConnectionError("bridge closed the connection")
+            return chunk
+        chunk = self.conn.read(self.conn.in_waiting or 1)
+        self.backlog = self.conn.in_waiting
+        return chunk
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+        # retry_at is set before conn is cleared; run() polls conn from another thread
+        self.retry_at = time.monotonic() + self.backoff_s
+        self.backoff_s = min(self.backoff_s * 2, RECONNECT_MAX_S)
+        self.stats["connected"] = False
+        self.connecting = False
+        self.conn = None
+
+    def decode(self, chunk, now):
+        """Consumes raw bytes and returns [(timestamp, (soil, smoke, ldr, flame)), ...]."""
+        self.stats["bytes"] += len(chunk)
+        if self.decoder is not None:
+            readings = self.decoder.feed(chunk, now)
+            self.stats["readings"] += len(readings)
+            return readings
+
+        readings = []
+        if self.probe is None:
+            sync_at = chunk.find(SYNC[:1])
+            if sync_at >= 0:
+                # Lines before the sync byte are CSV either way
+                readings = self._decode_csv(chunk[:sync_at], now)
+                chunk = chunk[sync_at:]
+                self.probe = FrameDecoder()
+                self.probe_bytes = 0
+
+        if self.probe is not None:
+            frames = self.probe.feed(chunk, now)
+            if frames:
+                # A frame passed its CRC: the sketch is sending binary, and CSV left over is stale
+                self.decoder, self.probe = self.probe, None
+                self.stats["protocol"] = "binary"
+                self.buffer.clear()
+                readings += frames
+                self.stats["readings"] += len(frames)
+                return readings
+            self.probe_bytes += len(chunk)
+            if self.probe_bytes > BINARY_PROBE_BYTES:
+                # No valid frame followed that 0xAA: it was line noise, keep reading CSV
+                self.probe = None
+                self.stats["false_syncs"] += 1
+
+        return readings + self._decode_csv(chunk, now)
+
+    def _decode_csv(self, chunk, now):
+        self.buffer += chunk
+        if b"\n" not in chunk:
+            if len(self.buffer) > MAX_LINE_BYTES:
+                # Garbage without line breaks (wrong baud rate); don't grow forever
+                self.stats["overruns"] += 1
+                self.buffer.clear()
+            return []
+        *lines, rest = self.buffer.split(b"\n")
+        self.buffer = bytearray(rest)
+        self.stats["lines"] += len(lines)
+        readings = []
+        for line in lines:
+            values = parse_csv_line(line)
+            if values is not None:
+                readings.append((now, values))
+            elif line.strip():
+                self.stats["parse_errors"] += 1
+        self.stats["readings"] += len(readings)
+        return readings
+
+    def snapshot(self):
+        stats = dict(self.stats, port=self.port)
+        if self.decoder is not None:
+            stats.update(self.decoder.stats)
+        return stats
+
+
+class IngestionEngine:
+    """Reads many devices concurrently from a single selector loop.
+
+    Every decoded reading is handed to `on_reading(device_name, timestamp,
+    (soil, smoke, ldr, flame))` on the engine thread. Devices that drop out are reopened with exponential backoff. Ports
+    that cannot be selected on (Windows COM handles) get a dedicated reader
+    thread instead, so the same engine works on every platform.
+    """
+
+    def __init__(self, devices, on_reading, baud_rate=9600, poll_s=0.5):
+        self.devices = [Device(name, port, baud_rate) for name, port in devices.items()]
+        self.on_reading = on_reading
+        self.poll_s = poll_s
+        self._selector = selectors.DefaultSelector()
+        self._thread = None
+        self._stop = threading.Event()
+        # Per device: seconds between a reading's timestamp and it reaching on_reading
+        self.read_lag = Histogram()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="ingestion", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self):
+        return {device.name: device.snapshot() for device in self.devices}
+
+    def run(self):
+        while not self._stop.is_set():
+            self._reconnect_due()
+            if not self._selector.get_map():
+                self._stop.wait(self.poll_s)
+                continue
+            for key, _ in self._selector.select(timeout=self.poll_s):
+                device = key.data
+                if device.connecting:
+                    self._finish_connect(device, key)
+                    continue
+                try:
+                    chunk = device.read()
+                except (OSError, serial.SerialException, ConnectionError) as e:
+                    log.warning("Lost device: %s", e, extra={"device": device.name, "port": device.port})
+                    self._selector.unregister(key.fileobj)
+                    device.close()
+                    continue
+                if chunk:
+                    self._dispatch(device, chunk)
+        for device in self.devices:
+            device.close()
+
+    def _dispatch(self, device, chunk):
+        readings = device.decode(chunk, time.time())
+        # Readings keep the time they were read at; for the lag, add how long their bytes sat
+        # queued: the rest of the chunk plus what the driver still holds, at the port's byte
+        # rate, spread evenly over the readings in the chunk
+        behind = len(chunk) + device.backlog
+        step = len(chunk) / len(readings) if readings else 0
+        for ts, values in readings:
+            behind -= step
+            # Binary frames also add their batching delay through `ts`
+            self.read_lag.observe(time.time() - ts + behind * device.byte_s, device.name)
+            try:
+                self.on_reading(device.name, ts, values)
+            except Exception:
+                log.exception("Error processing reading", extra={"device": device.name})
+
+    def _reconnect_due(self):
+        now = time.monotonic()
+        for device in self.devices:
+            if device.connecting and now > device.connect_deadline:
+                log.error("Could not open device: connect timed out",
+                          extra={"device": device.name, "port": device.port})
+                self._selector.unregister(device.conn)
+                device.close()
+                continue
+            if device.conn is not None or device.retry_at > now:
+                continue
+            try:
+                if not device.resolve():
+                    continue
+                device.open()
+            except (OSError, serial.SerialException) as e:
+                log.error("Could not open device: %s", e, extra={"device": device.name, "port": device.port})
+                device.close()
+                continue
+            if device.connecting:
+                self._selector.register(device.conn, selectors.EVENT_WRITE, device)
+                continue
+            self._start_reading(device)
+
+    def _finish_connect(self, device, key):
+        try:
+            device.finish_connect()
+        except OSError as e:
+            log.error("Could not open device: %s", e, extra={"device": device.name, "port": device.port})
+            self._selector.unregister(key.fileobj)
+            device.close()
+            return
+        self._selector.unregister(key.fileobj)
+        self._start_reading(device)
+
+    def _start_reading(self, device):
+        if device.ever_connected:
+            device.stats["reconnects"] += 1
+            log.info("Reconnected", extra={"device": device.name, "port": device.port})
+        else:
+            device.ever_connected = True
+            log.info("Connected", extra={"device": device.name, "port": device.port})
+
+        fd = device.fileno()
+        if fd is None:
+            threading.Thread(target=self._read_blocking, args=(device,),
+                             name=f"ingest-{device.name}", daemon=True).start()
+        else:
+            self._selector.register(fd, selectors.EVENT_READ, device)
+
+    def _read_blocking(self, device):
+        """Fallback reader for a port without a selectable descriptor."""
+        conn = device.conn
+        conn.timeout = 1
+        try:
+            while not self._stop.is_set():
+                chunk = device.read()
+                if chunk:
+                    self._dispatch(device, chunk)
+        except (OSError, serial.SerialException) as e:
+            log.warning("Lost device: %s", e, extra={"device": device.name, "port": device.port})
+        # run() reopens it once the backoff expires
+        device.close()
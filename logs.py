@@ -0,0 +1,83 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is a field
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+stats = {"dropped": 0}
+_listener = None
+
+
+def fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class TextFormatter(logging.Formatter):
+    """`2026-01-01 12:00:00 WARNING hazard.ingest Lost alpha device=alpha port=COM5`"""
+
+    def format(self, record):
+        line = (f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))} "
+                f"{record.levelname} {record.name} {record.getMessage()}")
+        extra = fields(record)
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname,
+                 "logger": record.name, "msg": record.getMessage()}
+        entry.update(fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; drops them rather than block when it falls behind."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+def setup_logging(level="INFO", fmt="text", max_queue=10000):
+    """Routes the "hazard" loggers (and Flask's) through a background writer to stderr.
+
+    Logging calls on the ingestion and notifier threads only enqueue the
+    record; formatting and the write to stderr happen on the writer thread.
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    records = queue.Queue(maxsize=max_queue)
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(_listener.stop)
+
+    handler = DroppingQueueHandler(records)
+    for name in ("hazard", "werkzeug"):
+        logger = logging.getLogger(name)
+        logger.addHandler(handler)
+        logger.setLevel(level.upper())
+        logger.propagate = False
+
+
+def snapshot():
+    return dict(stats, queued=_listener.queue.qsize() if _listener else 0)
@@ -0,0 +1,163 @@
+import bisect
+import threading
+
+# Seconds, from 10 µs (one rule evaluation) up to 10 s (a Pushbullet timeout)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with one series per label value.
+
+    `observe` is a bisect and two additions under a lock, cheap enough to run
+    for every reading. `snapshot` is plain JSON so it can travel over the bus.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label=""):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                # One count per bucket, one for +Inf, then the running sum
+                series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            series = {label: {"counts": s[:-1], "sum": s[-1]} for label, s in self._series.items()}
+        return {"buckets": list(self.buckets), "series": series}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Exposition:
+    """Builds a page in the Prometheus text format (version 0.0.4)."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, prefix="hazard_"):
+        self.prefix = prefix
+        self.lines = []
+
+    def add(self, name, kind, help_text, samples):
+        """Adds a counter or gauge; `samples` is a list of (labels dict, value)."""
+        samples = [(labels, value) for labels, value in samples if value is not None]
+        if not samples:
+            return
+        name = self.prefix + name
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name, help_text, snapshot, label_name=None):
+        """Adds a histogram from `Histogram.snapshot()`, one series per label value."""
+        if not snapshot or not snapshot["series"]:
+            return
+        name = self.prefix + name
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        bounds = snapshot["buckets"] + [float("inf")]
+        for label, series in sorted(snapshot["series"].items()):
+            labels = {label_name: label} if label_name else {}
+            total = 0
+            for bound, count in zip(bounds, series["counts"]):
+                total += count
+                self.lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(float(bound))))} {total}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {_number(series['sum'])}")
+            self.lines.append(f"{name}_count{_labels(labels)} {total}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def render(status, stream=None, http=None, logs=None, bus_connected=None):
+    """Maps the server's snapshots onto Prometheus metrics.
+
+    `status` is what app.ingestion_status() returns, locally or as received
+    over the bus; the other arguments belong to the process serving the request.
+    """
+    page = Exposition()
+    devices = status.get("devices") or {}
+
+    def per_device(key):
+        return [({"device": name}, d.get(key, 0)) for name, d in devices.items()]
+
+    page.add("device_connected", "gauge", "1 while the device's port is open.",
+             [({"device": name}, d.get("connected")) for name, d in devices.items()])
+    page.add("readings_total", "counter", "Readings decoded per device; rate() gives readings/s.",
+             per_device("readings"))
+    page.add("parse_errors_total", "counter", "CSV lines that could not be parsed.", per_device("parse_errors"))
+    page.add("corrupt_frames_total", "counter", "Binary frames rejected for a bad CRC or header.",
+             per_device("corrupt_frames"))
+    page.add("dropped_frames_total", "counter", "Binary frames lost, from sequence number gaps.",
+             per_device("dropped_frames"))
+    page.add("false_syncs_total", "counter", "Sync bytes on a CSV port that no valid binary frame followed.",
+             per_device("false_syncs"))
+    page.add("line_overruns_total", "counter", "Receive buffers discarded for having no line break.",
+             per_device("overruns"))
+    page.add("device_reconnects_total", "counter", "Times a device was reopened after dropping out.",
+             per_device("reconnects"))
+    page.add("received_bytes_total", "counter", "Bytes read from each device.", per_device("bytes"))
+    page.histogram("serial_read_lag_seconds",
+                   "Age of a reading when it enters the pipeline: bytes received after it, at the "
+                   "port's byte rate, plus decode time and the batching of binary frames.",
+                   status.get("read_lag"), "device")
+    page.histogram("rule_evaluation_seconds", "Time to evaluate every rule against one reading.",
+                   status.get("rule_eval"))
+    page.add("rules_version", "gauge", "Times rules.json has been loaded.",
+             [({}, status.get("rules_version"))])
+
+    notifier = status.get("notifier") or {}
+    for key, help_text in (("enqueued", "Notifications queued for delivery."),
+                           ("coalesced", "Duplicate notifications merged into an earlier one."),
+                           ("dropped", "Notifications dropped because the queue was full."),
+                           ("sent", "Notifications delivered."),
+                           ("failed", "Notifications that failed after every retry."),
+                           ("retries", "Pushbullet requests retried.")):
+        page.add(f"notifications_{key}_total", "counter", help_text, [({}, notifier.get(key))])
+    page.add("notification_queue_depth", "gauge", "Notifications waiting for a worker.",
+             [({}, notifier.get("queue_depth"))])
+    page.add("notification_queue_capacity", "gauge", "Size of the notification queue.",
+             [({}, notifier.get("queue_capacity"))])
+    page.histogram("notification_send_seconds", "Time from queueing a notification to its delivery or failure.",
+                   status.get("notification_latency"))
+
+    history = status.get("history") or {}
+    page.add("history_written_total", "counter", "Readings committed to the history database.",
+             [({}, history.get("written"))])
+    page.add("history_dropped_total", "counter", "Readings dropped because the history queue was full.",
+             [({}, history.get("dropped"))])
+
+    if stream:
+        page.add("stream_subscribers", "gauge", "Open /stream connections.", [({}, stream.get("subscribers"))])
+        page.add("stream_dropped_frames_total", "counter", "Stream frames skipped for slow clients.",
+                 [({}, stream.get("dropped_frames"))])
+    if bus_connected is not None:
+        page.add("bus_connected", "gauge", "1 while this web worker is following the ingestion process.",
+                 [({}, bus_connected)])
+    if logs:
+        page.add("log_records_dropped_total", "counter", "Log records dropped because the log queue was full.",
+                 [({}, logs.get("dropped"))])
+    page.histogram("http_request_seconds", "Time to produce each HTTP response, per route.", http, "route")
+    return page.text()
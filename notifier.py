@@ -0,0 +1,167 @@
+import logging
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Histogram
+
+log = logging.getLogger("hazard.notifier")
+
+# What submit() did with a notification
+QUEUED = "queued"
+COALESCED = "coalesced"
+DROPPED = "dropped"
+
+
+class NotificationDispatcher:
+    """Delivers Pushbullet notifications from a background worker pool.
+
+    Callers only enqueue; the HTTP work (timeouts, retries, backoff) happens on
+    the workers so the serial reader is never blocked by the network. An alert
+    identical (title and body) to one still waiting in the queue is coalesced
+    into it; how often an alert may repeat is up to the rule cooldowns.
+    """
+
+    def __init__(self, api_url, headers, workers=2, max_queue=100,
+                 timeout=(3.05, 10), retries=3, backoff_s=0.5):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_s = backoff_s
+
+        # One keep-alive session shared by every worker
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        # (title, body) of every notification still waiting for a worker
+        self._pending = set()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"notifier-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._started = False
+        # Optional hook called as on_delivered(title, severity, origin, ok) after each send
+        self.on_delivered = None
+
+        self.stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "enqueue_max_s": 0.0,
+            "send_latency_last_s": 0.0,
+            "send_latency_max_s": 0.0,
+            "send_latency_total_s": 0.0,
+        }
+        # Queue-to-delivery time of every notification, for /metrics
+        self.latency = Histogram()
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            for worker in self._workers:
+                worker.start()
+        return self
+
+    def submit(self, title, body, severity="info", origin=None):
+        """Queues a notification without blocking.
+
+        Returns QUEUED, COALESCED (an identical alert is still waiting in the
+        queue) or DROPPED (the queue is full). `origin` (epoch seconds) is
+        passed through to `on_delivered` untouched.
+        """
+        started = time.perf_counter()
+        key = (title, body)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+                return COALESCED
+            self._pending.add(key)
+
+        try:
+            self._queue.put_nowait((title, body, severity, now, origin))
+            accepted = True
+        except queue.Full:
+            accepted = False
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if accepted:
+                self.stats["enqueued"] += 1
+            else:
+                self.stats["dropped"] += 1
+                self._pending.discard(key)
+                log.warning("Notification queue full, dropped", extra={"title": title})
+            self.stats["enqueue_max_s"] = max(self.stats["enqueue_max_s"], elapsed)
+        return QUEUED if accepted else DROPPED
+
+    def join(self):
+        """Blocks until every queued notification has been attempted."""
+        self._queue.join()
+
+    def snapshot(self):
+        """Returns a copy of the counters plus the current queue depth."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        done = stats["sent"] + stats["failed"]
+        stats["send_latency_avg_s"] = stats["send_latency_total_s"] / done if done else 0.0
+        return stats
+
+    def _worker(self):
+        while True:
+            title, body, severity, queued_at, origin = self._queue.get()
+            with self._lock:
+                # From here on an identical alert is a new notification, not a duplicate
+                self._pending.discard((title, body))
+            try:
+                ok = self._send(title, body)
+            finally:
+                self._queue.task_done()
+
+            latency = time.monotonic() - queued_at
+            with self._lock:
+                self.stats["sent" if ok else "failed"] += 1
+                self.stats["send_latency_last_s"] = latency
+                self.stats["send_latency_max_s"] = max(self.stats["send_latency_max_s"], latency)
+                self.stats["send_latency_total_s"] += latency
+            self.latency.observe(latency)
+            if self.on_delivered is not None:
+                try:
+                    self.on_delivered(title, severity, origin, ok)
+                except Exception:
+                    # A broken hook must not take a worker out of the pool
+                    log.exception("Error in on_delivered hook", extra={"title": title})
+
+    def _send(self, title, body):
+        payload = {"type": "note", "title": title, "body": body}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff_s * (2 ** (attempt - 1)))
+            try:
+                res = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                log.warning("Error sending Pushbullet notification: %s", e, extra={"title": title, "attempt": attempt})
+                continue
+            if res.status_code == 200:
+                log.info("Pushbullet notification sent", extra={"title": title})
+                return True
+            log.warning("Notification failed: %s", res.text[:200], extra={"title": title, "status": res.status_code})
+            # Client errors (bad token, bad payload) will not succeed on retry
+            if res.status_code < 500 and res.status_code != 429:
+                return False
+        return False
@@ -0,0 +1,87 @@
+import logging
+import math
+import os
+import sys
+import threading
+from collections import Counter
+
+log = logging.getLogger("hazard.profiler")
+
+
+class SamplingProfiler:
+    """Opt-in statistical profiler for the running server.
+
+    While started, a background thread snapshots every thread's stack each
+    `interval_s` and counts identical stacks. Nothing is instrumented and
+    nothing runs while it is stopped, so it can stay loaded in production.
+    `collapsed()` returns the counts in the collapsed-stack format
+    ("thread;outer;inner count" per line) that flamegraph.pl and speedscope
+    read directly.
+    """
+
+    def __init__(self, interval_s=0.005, max_depth=64):
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval_s=None):
+        if interval_s is not None and not (interval_s > 0 and math.isfinite(interval_s)):
+            # Zero or negative would make the sampling loop spin without ever waiting
+            raise ValueError("interval_s must be a positive number of seconds")
+        with self._lock:
+            if self._thread is not None:
+                return False
+            if interval_s is not None:
+                self.interval_s = interval_s
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        log.info("Sampling profiler started", extra={"interval_s": self.interval_s})
+        return True
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return False
+        self._stop.set()
+        thread.join()
+        log.info("Sampling profiler stopped", extra={"samples": self.samples})
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def collapsed(self):
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(sampled)
+                self.samples += 1
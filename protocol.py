@@ -0,0 +1,123 @@
+"""Wire formats spoken by the Arduino sketch.
+
+CSV (the original format): one ``soil,smoke,ldr,flame\\n`` line per reading.
+
+Binary frames, for sampling at 50-100 Hz over the same 9600 baud link::
+
+    offset  size  field
+    0       2     sync bytes 0xAA 0x55
+    2       2     sequence number, uint16 little-endian, wraps at 65535
+    4       1     sample count N (1..MAX_SAMPLES)
+    5       1     sample interval in milliseconds
+    6       4*N   samples, uint32 little-endian each:
+                  bits 0-9 soil, 10-19 smoke, 20-29 ldr, bit 30 flame
+    6+4N    2     CRC-16/CCITT-FALSE of bytes 2..6+4N, little-endian
+
+0xAA never appears in the ASCII format, so one seen on a CSV port starts a
+trial binary decode; the port switches over once a whole frame passes its
+CRC, and a stray 0xAA from line noise leaves it on CSV.
+"""
+import binascii
+import struct
+
+SYNC = b"\xaa\x55"
+HEADER = struct.Struct("<2sHBB")
+SAMPLE = struct.Struct("<I")
+CRC = struct.Struct("<H")
+MAX_SAMPLES = 64
+SENSORS = ("soil", "smoke", "ldr", "flame")
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def unpack_sample(word):
+    return word & 0x3FF, (word >> 10) & 0x3FF, (word >> 20) & 0x3FF, (word >> 30) & 0x1
+
+
+def pack_frame(seq, samples, interval_ms):
+    """Builds one frame; used by tools and tests to stand in for the sketch."""
+    payload = HEADER.pack(SYNC, seq & 0xFFFF, len(samples), interval_ms)[2:] + b"".join(
+        SAMPLE.pack(soil | smoke << 10 | ldr << 20 | (flame & 1) << 30)
+        for soil, smoke, ldr, flame in samples
+    )
+    return SYNC + payload + CRC.pack(crc16(payload))
+
+
+def parse_csv_line(line):
+    """Parses ``soil,smoke,ldr,flame``. Returns a 4-tuple of ints, or None if malformed."""
+    parts = line.split(b",")
+    if len(parts) != 4:
+        return None
+    try:
+        return int(parts[0]), int(parts[1]), int(parts[2]), int(parts[3])
+    except ValueError:
+        return None
+
+
+class FrameDecoder:
+    """Incremental decoder for the binary format.
+
+    Frames are validated in place through a memoryview over the receive
+    buffer; only the decoded integers are copied out. Bad CRCs and sequence
+    gaps are counted rather than raised.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.last_seq = None
+        self.stats = {"frames": 0, "samples": 0, "corrupt_frames": 0,
+                      "dropped_frames": 0, "discarded_bytes": 0}
+
+    def feed(self, chunk, now):
+        """Adds received bytes and returns [(timestamp, (soil, smoke, ldr, flame)), ...]."""
+        buf = self.buffer
+        buf += chunk
+        out = []
+        pos = 0
+        view = memoryview(buf)
+        try:
+            while True:
+                start = buf.find(SYNC, pos)
+                if start < 0:
+                    # Keep a trailing 0xAA, it may be the first half of the next sync
+                    keep = 1 if buf.endswith(SYNC[:1]) else 0
+                    self.stats["discarded_bytes"] += len(buf) - pos - keep
+                    pos = len(buf) - keep
+                    break
+                self.stats["discarded_bytes"] += start - pos
+                pos = start
+                if len(buf) - start < HEADER.size:
+                    break
+                _, seq, count, interval_ms = HEADER.unpack_from(view, start)
+                if not 0 < count <= MAX_SAMPLES:
+                    self.stats["corrupt_frames"] += 1
+                    pos = start + 1
+                    continue
+                end = start + HEADER.size + SAMPLE.size * count
+                if len(buf) < end + CRC.size:
+                    break
+                if crc16(view[start + 2:end]) != CRC.unpack_from(view, end)[0]:
+                    self.stats["corrupt_frames"] += 1
+                    pos = start + 1
+                    continue
+
+                if self.last_seq is not None:
+                    gap = (seq - self.last_seq - 1) & 0xFFFF
+                    # A huge "gap" is the sketch restarting, not 60k lost frames
+                    if gap < 0x8000:
+                        self.stats["dropped_frames"] += gap
+                self.last_seq = seq
+                self.stats["frames"] += 1
+                self.stats["samples"] += count
+
+                step = interval_ms / 1000
+                first = now - step * (count - 1)
+                for i, (word,) in enumerate(SAMPLE.iter_unpack(view[start + HEADER.size:end])):
+                    out.append((first + step * i, unpack_sample(word)))
+                pos = end + CRC.size
+        finally:
+            view.release()
+        del buf[:pos]
+        return out
@@ -0,0 +1,290 @@
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from array import array
+
+from conditioning import FEATURES, SENSORS
+from metrics import Histogram
+
+log = logging.getLogger("hazard.rules")
+
+OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Everything a rule can test: raw sensors and the conditioned "<sensor>.<feature>" signals
+SIGNALS = frozenset(SENSORS) | {f"{sensor}.{feature}" for sensor in SENSORS for feature in FEATURES}
+
+# Per-rule slots in a device's flat state array
+ACTIVE, ACTIVE_SINCE, PENDING_SINCE, ESCALATED = range(4)
+SLOTS = 4
+
+
+class RuleError(ValueError):
+    """Raised when a rule file cannot be compiled."""
+
+
+def _display(value):
+    """Conditioned signals are floats; show whole numbers the way raw readings look."""
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else round(value, 1)
+    return value
+
+
+def _between(value, bounds):
+    return bounds[0] <= value < bounds[1]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _number(rule_id, name, value, default=None):
+    """Checks an optional non-negative number, so mistakes fail at load time instead of in evaluate()."""
+    if value is None:
+        return default
+    if not _is_number(value) or value < 0:
+        raise RuleError(f"{rule_id}: {name!r} must be a non-negative number")
+    return value
+
+
+def _message(rule_id, name, text):
+    if not isinstance(text, str):
+        raise RuleError(f"{rule_id}: {name!r} must be a string")
+    try:
+        text.format(value=0, device="")
+    except (KeyError, IndexError, ValueError) as e:
+        raise RuleError(f"{rule_id}: {name!r} may only use {{value}} and {{device}} ({e})") from None
+    return text
+
+
+class CompiledRules:
+    """An immutable, flattened form of a rule file.
+
+    Each rule becomes one tuple of plain values so evaluation is a single loop
+    with no dict lookups beyond the reading itself. A device's state is one
+    `array('d')`: SLOTS entries per rule followed by one last-sent time per
+    cooldown group.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        if not isinstance(config, dict):
+            raise RuleError("rule file must be a JSON object")
+        cooldowns = config.get("cooldowns_s", {})
+        if not isinstance(cooldowns, dict):
+            raise RuleError("'cooldowns_s' must map cooldown groups to seconds")
+        for key, seconds in cooldowns.items():
+            _number(key, "cooldowns_s", seconds)
+        default_escalation = _number("rule file", "escalation_delay_s", config.get("escalation_delay_s"))
+        rules = config.get("rules")
+        if not isinstance(rules, list) or not rules:
+            raise RuleError("rule file needs a non-empty 'rules' list")
+
+        if not all(isinstance(rule, dict) for rule in rules):
+            raise RuleError("every rule must be a JSON object")
+        self.rule_ids = [rule.get("id") for rule in rules]
+        if None in self.rule_ids or len(set(self.rule_ids)) != len(self.rule_ids):
+            raise RuleError("every rule needs a unique 'id'")
+        self.cooldown_keys = []
+        self.rules = []
+
+        for index, rule in enumerate(rules):
+            rule_id = rule["id"]
+            op = rule.get("op")
+            threshold = rule.get("threshold")
+            if op == "between":
+                if not (isinstance(threshold, list) and len(threshold) == 2
+                        and all(_is_number(bound) for bound in threshold)):
+                    raise RuleError(f"{rule_id}: 'between' needs a numeric [low, high] threshold")
+                test = _between
+                threshold = tuple(threshold)
+                clear = threshold
+            elif op in OPS:
+                test = OPS[op]
+                clear = rule.get("clear", threshold)
+                if not (_is_number(threshold) and _is_number(clear)):
+                    raise RuleError(f"{rule_id}: 'threshold' and 'clear' must be numbers")
+            else:
+                raise RuleError(f"{rule_id}: unknown op {op!r}")
+            if "sensor" not in rule or "title" not in rule:
+                raise RuleError(f"{rule_id}: 'sensor' and 'title' are required")
+            if rule["sensor"] not in SIGNALS:
+                raise RuleError(f"{rule_id}: unknown sensor {rule['sensor']!r}, expected one of "
+                                f"{', '.join(SENSORS)} or <sensor>.<{'|'.join(FEATURES)}>")
+            title = _message(rule_id, "title", rule["title"])
+            body = _message(rule_id, "body", rule.get("body", ""))
+            severity = rule.get("severity", "info")
+            if not isinstance(severity, str):
+                raise RuleError(f"{rule_id}: 'severity' must be a string")
+
+            key = rule.get("cooldown", rule_id)
+            if key not in self.cooldown_keys:
+                self.cooldown_keys.append(key)
+            unless = rule.get("unless")
+            if unless is not None:
+                if unless not in self.rule_ids[:index]:
+                    raise RuleError(f"{rule_id}: 'unless' must name an earlier rule")
+                unless = self.rule_ids.index(unless) * SLOTS
+
+            escalation = rule.get("escalation")
+            if escalation:
+                if not isinstance(escalation, dict) or "title" not in escalation:
+                    raise RuleError(f"{rule_id}: 'escalation' must be an object with a 'title'")
+                escalate_after = _number(rule_id, "after_s", escalation.get("after_s"), default_escalation)
+                if escalate_after is None:
+                    raise RuleError(f"{rule_id}: escalation needs 'after_s' or a global 'escalation_delay_s'")
+                escalation_severity = escalation.get("severity", "escalation")
+                if not isinstance(escalation_severity, str):
+                    raise RuleError(f"{rule_id}: escalation 'severity' must be a string")
+                escalation = (_message(rule_id, "escalation title", escalation["title"]),
+                              _message(rule_id, "escalation body", escalation.get("body", "")),
+                              escalation_severity, escalate_after)
+
+            self.rules.append((
+                index * SLOTS,
+                rule["sensor"],
+                test,
+                threshold,
+                clear,
+                _number(rule_id, "debounce_s", rule.get("debounce_s"), 0),
+                self.cooldown_keys.index(key),
+                cooldowns.get(key, 0),
+                unless,
+                title,
+                body,
+                severity,
+                escalation,
+            ))
+
+        self.cooldown_base = len(self.rules) * SLOTS
+        self.state_size = self.cooldown_base + len(self.cooldown_keys)
+
+    def new_state(self, previous=None):
+        """A zeroed state array, carrying over matching rules from `previous` (ruleset, state)."""
+        state = array("d", bytes(8 * self.state_size))
+        if previous is not None:
+            old, old_state = previous
+            for index, rule_id in enumerate(self.rule_ids):
+                if rule_id in old.rule_ids:
+                    src = old.rule_ids.index(rule_id) * SLOTS
+                    state[index * SLOTS:index * SLOTS + SLOTS] = old_state[src:src + SLOTS]
+            for index, key in enumerate(self.cooldown_keys):
+                if key in old.cooldown_keys:
+                    state[self.cooldown_base + index] = old_state[old.cooldown_base + old.cooldown_keys.index(key)]
+        return state
+
+    def evaluate(self, state, reading, now, device=""):
+        """Runs every rule over one reading, updating `state` in place.
+
+        Returns the notifications to send as (title, body, severity, sensor) tuples,
+        where sensor is the base sensor name ("smoke" for "smoke.median").
+        """
+        out = []
+        cooldown_base = self.cooldown_base
+        for (base, sensor, test, threshold, clear, debounce, cd_index, cooldown,
+             unless, title, body, severity, escalation) in self.rules:
+            value = reading[sensor]
+            was_active = state[base + ACTIVE]
+            # Hysteresis: an active rule only clears once the value crosses `clear`
+            condition = test(value, clear if was_active else threshold)
+            if condition and unless is not None and state[unless + ACTIVE]:
+                condition = False
+
+            if not condition:
+                state[base + ACTIVE] = 0
+                state[base + ACTIVE_SINCE] = 0
+                state[base + PENDING_SINCE] = 0
+                continue
+
+            if not was_active:
+                # Debounce: the condition must hold for `debounce` seconds first
+                pending = state[base + PENDING_SINCE]
+                if not pending:
+                    state[base + PENDING_SINCE] = pending = now
+                if now - pending < debounce:
+                    continue
+                state[base + ACTIVE] = 1
+
+            last_sent = cooldown_base + cd_index
+            if now - state[last_sent] > cooldown:
+                out.append((title, body.format(value=_display(value), device=device), severity,
+                            sensor.partition(".")[0]))
+                state[last_sent] = now
+
+            if escalation is not None:
+                if not state[base + ACTIVE_SINCE]:
+                    state[base + ACTIVE_SINCE] = now
+                    state[base + ESCALATED] = 0
+                elif not state[base + ESCALATED] and now - state[base + ACTIVE_SINCE] > escalation[3]:
+                    out.append((escalation[0], escalation[1].format(value=_display(value), device=device),
+                                escalation[2], sensor.partition(".")[0]))
+                    state[base + ESCALATED] = 1
+        return out
+
+
+class RuleEngine:
+    """Evaluates readings against a rule file that is reloaded when it changes on disk."""
+
+    def __init__(self, path, check_interval_s=1.0):
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        # device -> (ruleset the state belongs to, state array)
+        self._states = {}
+        self.version = 0
+        self.ruleset = None
+        self.eval_time = Histogram()
+        self.reload()
+
+    def reload(self):
+        """Recompiles the rule file. A broken file keeps the rules already loaded."""
+        with self._lock:
+            try:
+                # Remember the mtime even if loading fails, so a broken save is reported once
+                self._mtime = os.stat(self.path).st_mtime
+                with open(self.path, encoding="utf-8") as f:
+                    ruleset = CompiledRules(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                if self.ruleset is None:
+                    raise
+                log.error("Keeping previous alert rules, could not load them: %s", e, extra={"path": self.path})
+                return False
+            self.ruleset = ruleset
+            self.version += 1
+        log.info("Loaded %d alert rules", len(ruleset.rules), extra={"path": self.path, "version": self.version})
+        return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval_s
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def evaluate(self, device, reading, now):
+        started = time.perf_counter()
+        self.maybe_reload()
+        ruleset = self.ruleset
+        entry = self._states.get(device)
+        if entry is None or entry[0] is not ruleset:
+            entry = (ruleset, ruleset.new_state(entry))
+            self._states[device] = entry
+        out = ruleset.evaluate(entry[1], reading, now, device)
+        self.eval_time.observe(time.perf_counter() - started)
+        return out
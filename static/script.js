@@ -2,7 +2,9 @@
 
 document.addEventListener('DOMContentLoaded', function () {
     const MAX_DATA_POINTS = 20;
-    const shownNotificationTimestamps = new Set(); // Track displayed toast alerts
+    const DEVICE = encodeURIComponent(window.HAZARD_DEVICE || '');
+    const MAX_LOGGED_NOTIFICATIONS = 20;
+    let lastNotificationSeq = null; // Cursor into /notifications; null until the first load
 
     const chartConfig = (label) => ({
         type: 'line',
@@ -38,35 +40,83 @@ document.addEventListener('DOMContentLoaded', function () {
         chart.update('none');
     }
     
+    // Refill the charts from stored history so a reload doesn't start empty
+    async function loadRecentHistory() {
+        const to = Date.now() / 1000;
+        const from = to - MAX_DATA_POINTS;
+        const charts = { soil: soilChart, smoke: smokeChart, ldr: ldrChart };
+        await Promise.all(Object.entries(charts).map(async ([sensor, chart]) => {
+            try {
+                const res = await fetch(`/history?sensor=${sensor}&from=${from}&to=${to}&resolution=1s&device=${DEVICE}`);
+                const history = await res.json();
+                history.points.forEach(point => {
+                    updateChart(chart, new Date(point.t * 1000).toLocaleTimeString(), point.mean);
+                });
+            } catch (error) {
+                console.error(`Error loading ${sensor} history:`, error);
+            }
+        }));
+    }
+
+    function handleReading(data) {
+        if (data.device && data.device !== window.HAZARD_DEVICE) return;
+        const timestamp = new Date().toLocaleTimeString();
+        updateChart(soilChart, timestamp, data.soil);
+        updateChart(smokeChart, timestamp, data.smoke);
+        updateChart(ldrChart, timestamp, data.ldr);
+
+        document.getElementById('soilValue').innerText = data.soil;
+        document.getElementById('smokeValue').innerText = data.smoke;
+        document.getElementById('ldrValue').innerText = data.ldr;
+
+        updateStatusText(data);
+        updateFlameAlert(data.flame);
+        updateHistoryLog(data);
+    }
+
+    // Readings are pushed by the server as they arrive; polling is only a fallback
+    function connectStream() {
+        if (!window.EventSource) {
+            setInterval(fetchData, 2000);
+            return;
+        }
+        const source = window.liveStream || new EventSource(`/stream?device=${DEVICE}`);
+        source.addEventListener('reading', (event) => handleReading(JSON.parse(event.data)));
+        source.onerror = () => console.warn("Live stream interrupted, reconnecting...");
+    }
+
     async function fetchData() {
         try {
-            const [dataRes, notifRes] = await Promise.all([
-                fetch('/data'),
-                fetch('/notifications')
-            ]);
-            const data = await dataRes.json();
-            const notifications = await notifRes.json();
-
-            const timestamp = new Date().toLocaleTimeString();
-            updateChart(soilChart, timestamp, data.soil);
-            updateChart(smokeChart, timestamp, data.smoke);
-            updateChart(ldrChart, timestamp, data.ldr);
-
-            document.getElementById('soilValue').innerText = data.soil;
-            document.getElementById('smokeValue').innerText = data.smoke;
-            document.getElementById('ldrValue').innerText = data.ldr;
-            
-            updateStatusText(data);
-            updateFlameAlert(data.flame);
-            updateHistoryLog(data);
-            updatePushbulletLog(notifications);
-            processNotifications(notifications);
-
+            const dataRes = await fetch(`/data?device=${DEVICE}`);
+            handleReading(await dataRes.json());
         } catch (error) {
             console.error("Error fetching data:", error);
         }
     }
 
+    // Only asks for events after the last one seen, so each poll costs O(new events)
+    async function fetchNotifications() {
+        const firstLoad = lastNotificationSeq === null;
+        const url = firstLoad
+            ? `/notifications?limit=${MAX_LOGGED_NOTIFICATIONS}`
+            : `/notifications?after=${lastNotificationSeq}`;
+        try {
+            const notifRes = await fetch(url);
+            const page = await notifRes.json();
+            if (!firstLoad && page.next < lastNotificationSeq) {
+                // The server's log was reset; reload the latest events on the next tick
+                lastNotificationSeq = null;
+                return;
+            }
+            lastNotificationSeq = page.next;
+            updatePushbulletLog(page.events);
+            // Events already in the log on page load are history, not new alerts
+            if (!firstLoad) page.events.forEach(displayToastAlert);
+        } catch (error) {
+            console.error("Error fetching notifications:", error);
+        }
+    }
+
     function updateStatusText(data) {
         const soilStatusEl = document.getElementById('soilStatus');
         if (data.soil < 400) {
@@ -139,11 +189,15 @@ document.addEventListener('DOMContentLoaded', function () {
     
     function updatePushbulletLog(notifications) {
         const pushbulletLog = document.getElementById('pushbulletLog');
-        pushbulletLog.innerHTML = '';
         if (notifications.length === 0) {
-            pushbulletLog.innerHTML = '<p class="text-muted p-2">No notifications sent recently.</p>';
+            if (pushbulletLog.children.length === 0) {
+                pushbulletLog.innerHTML = '<p class="text-muted p-2 empty-log">No notifications sent recently.</p>';
+            }
             return;
         }
+        const placeholder = pushbulletLog.querySelector('.empty-log');
+        if (placeholder) placeholder.remove();
+        // Oldest first from the server, so prepending leaves the newest on top
         notifications.forEach(notif => {
             const entry = document.createElement('div');
             entry.className = 'list-group-item list-group-item-action flex-column align-items-start log-entry';
@@ -151,20 +205,15 @@ document.addEventListener('DOMContentLoaded', function () {
             entry.innerHTML = `
                 <div class="d-flex w-100 justify-content-between">
                     <h6 class="mb-1"><b>${notif.title}</b></h6>
-                    <small>${notif.timestamp.split('.')[0]}</small>
+                    <small>${new Date(notif.ts * 1000).toLocaleString()}</small>
                 </div>
-                <p class="mb-1 small">${notif.body}</p>`;
-            pushbulletLog.appendChild(entry);
-        });
-    }
-
-    function processNotifications(notifications) {
-        notifications.forEach(notif => {
-            if (!shownNotificationTimestamps.has(notif.timestamp)) {
-                displayToastAlert(notif);
-                shownNotificationTimestamps.add(notif.timestamp);
-            }
+                <p class="mb-1 small">${notif.body}</p>
+                ${notif.undelivered ? '<small class="text-danger">Push not delivered (queue full)</small>' : ''}`;
+            pushbulletLog.prepend(entry);
         });
+        while (pushbulletLog.children.length > MAX_LOGGED_NOTIFICATIONS) {
+            pushbulletLog.removeChild(pushbulletLog.lastChild);
+        }
     }
 
     function displayToastAlert(notif) {
@@ -212,7 +261,8 @@ document.addEventListener('DOMContentLoaded', function () {
         setDarkMode(true);
     }
 
-    // Initial fetch and interval
-    fetchData();
-    setInterval(fetchData, 800);
+    // Live readings over the stream, notifications on an interval
+    loadRecentHistory().then(connectStream);
+    fetchNotifications();
+    setInterval(fetchNotifications, 2000);
 });
\ No newline at end of file
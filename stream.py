@@ -0,0 +1,81 @@
+import json
+import queue
+import threading
+
+
+class Broadcaster:
+    """Fans each published event out to every Server-Sent Events subscriber.
+
+    An event is serialized once into a shared frame; subscribers each get a
+    small bounded queue and simply miss frames when they fall behind, so one
+    slow dashboard never holds up the serial reader or the other clients.
+    Events published for a device only reach subscribers of that device and
+    subscribers of every device (device None).
+    """
+
+    def __init__(self, client_queue_size=16, heartbeat_s=15):
+        self.client_queue_size = client_queue_size
+        self.heartbeat_s = heartbeat_s
+        # device (None for all devices) -> queues of the clients following it
+        self._subscribers = {}
+        # Most recent frame per (event type, device), replayed to new subscribers
+        self._last = {}
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "dropped_frames": 0}
+
+    def publish(self, event, data, device=None):
+        """Serializes `data` once and offers the frame to every interested subscriber."""
+        frame = self.frame(event, data)
+        with self._lock:
+            self._last[(event, device)] = frame
+            subscribers = list(self._subscribers.get(None, ()))
+            if device is not None:
+                subscribers += self._subscribers.get(device, ())
+            self.stats["published"] += 1
+        dropped = 0
+        for q in subscribers:
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            with self._lock:
+                self.stats["dropped_frames"] += dropped
+
+    def subscribe(self, device=None):
+        """Yields encoded SSE frames for one client until it disconnects.
+
+        With a `device`, the client only gets that device's events plus the
+        events not tied to any device.
+        """
+        q = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(device, set()).add(q)
+            initial = [frame for (_, key), frame in self._last.items()
+                       if device is None or key in (None, device)]
+        try:
+            yield b"retry: 2000\n\n"
+            for frame in initial:
+                yield frame
+            while True:
+                try:
+                    yield q.get(timeout=self.heartbeat_s)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield b": heartbeat\n\n"
+        finally:
+            with self._lock:
+                clients = self._subscribers[device]
+                clients.discard(q)
+                if not clients:
+                    del self._subscribers[device]
+
+    @staticmethod
+    def frame(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["subscribers"] = sum(len(clients) for clients in self._subscribers.values())
+        return stats
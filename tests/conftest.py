@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top level of the repository, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """app.py imported against a scratch history database."""
+    os.environ["HAZARD_HISTORY_DB"] = str(tmp_path_factory.mktemp("app") / "history.db")
+    import app
+    return app
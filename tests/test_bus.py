@@ -0,0 +1,74 @@
+import json
+import os
+import socket
+import time
+
+import pytest
+
+from bus import BusPublisher, BusSubscriber, bus_is_live
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="unix sockets")
+
+
+@pytest.fixture
+def address(tmp_path):
+    return f"unix://{tmp_path / 'bus.sock'}"
+
+
+def wait_for(condition, timeout_s=5):
+    deadline = time.time() + timeout_s
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_subscriber_gets_the_snapshot_then_live_messages(address):
+    publisher = BusPublisher(address, snapshot=lambda: [("status", {"up": True})]).start()
+    received = []
+    BusSubscriber(address, lambda event, data: received.append((event, data))).start()
+    assert wait_for(lambda: publisher.stats["subscribers"] == 1)
+    publisher.publish("notification", {"seq": 1})
+    assert wait_for(lambda: len(received) == 2)
+    assert received == [("status", {"up": True}), ("notification", {"seq": 1})]
+
+
+def test_refuses_to_take_over_a_live_bus(address):
+    BusPublisher(address).start()
+    assert bus_is_live(address)
+    with pytest.raises(OSError):
+        BusPublisher(address).start()
+
+
+def test_reclaims_a_stale_socket_file(address):
+    path = address[len("unix://"):]
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+    assert os.path.exists(path) and not bus_is_live(address)
+    BusPublisher(address).start()
+    assert bus_is_live(address)
+
+
+def test_slow_subscriber_is_disconnected_instead_of_missing_messages(address):
+    publisher = BusPublisher(address, client_queue_size=8).start()
+    slow = socket.socket(socket.AF_UNIX)
+    slow.connect(address[len("unix://"):])
+    assert wait_for(lambda: publisher.stats["subscribers"] == 1)
+    # Never read: the socket buffer fills, then the queue, then the link is dropped
+    payload = "x" * 4096
+    for seq in range(2000):
+        publisher.publish("notification", {"seq": seq, "body": payload})
+        if publisher.stats["slow_disconnects"]:
+            break
+    assert publisher.stats["slow_disconnects"] == 1
+    assert wait_for(lambda: publisher.stats["subscribers"] == 0)
+
+    # Whatever did arrive is a gapless prefix, then end of stream (a cut-off last line aside)
+    seqs = []
+    with slow.makefile("rb") as stream:
+        for line in stream:
+            if line.endswith(b"\n"):
+                seqs.append(json.loads(line)["data"]["seq"])
+    assert seqs == list(range(len(seqs)))
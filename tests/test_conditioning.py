@@ -0,0 +1,26 @@
+import random
+
+import pytest
+
+from conditioning import SignalConditioner
+
+
+def trace(count, seed=1):
+    rng = random.Random(seed)
+    times = [1_700_000_000 + i * 0.02 + rng.random() * 0.005 for i in range(count)]
+    samples = [(rng.randint(0, 1023), rng.randint(0, 1023), rng.randint(0, 1023), rng.randint(0, 1))
+               for _ in times]
+    return times, samples
+
+
+@pytest.mark.parametrize("window,median_window", [(16, 3), (5, 5), (8, 4)])
+def test_batch_matches_streaming_updates(window, median_window):
+    times, samples = trace(200)
+    streaming = SignalConditioner(window, median_window)
+    expected = [streaming.update(t, s) for t, s in zip(times, samples)]
+    batched = SignalConditioner(window, median_window).signals_batch(times, samples)
+    assert len(batched) == len(expected)
+    for want, got in zip(expected, batched):
+        assert got.keys() == want.keys()
+        for key, value in want.items():
+            assert got[key] == pytest.approx(value, rel=1e-6, abs=1e-6), key
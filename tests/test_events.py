@@ -0,0 +1,153 @@
+import sqlite3
+import time
+
+import pytest
+
+from events import EventLog
+
+SEVERITIES = ("critical", "info", "escalation")
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "history.db")
+
+
+def fill(log, count, start_ts=1_700_000_000.0):
+    for i in range(count):
+        log.append(f"alert {i}", "body", SEVERITIES[i % 3], device="alpha", sensor=("smoke", "soil")[i % 2],
+                   ts=start_ts + i)
+
+
+def page_all(log, limit, **filters):
+    """Follows the cursor from the start of the log; returns every seq seen."""
+    seen, cursor = [], 0
+    while True:
+        events, next_seq = log.after(cursor, limit=limit, **filters)
+        seen += [e["seq"] for e in events]
+        if not events:
+            return seen
+        assert next_seq >= events[-1]["seq"]
+        cursor = next_seq
+
+
+def test_cursor_pagination_across_memory_and_disk(db):
+    log = EventLog(db, memory_events=10, spill_batch=5)
+    fill(log, 35)
+    log.flush()
+    assert log.snapshot()["in_memory"] == 10
+    # Pages straddle the boundary between rows on disk (1-25) and memory (26-35)
+    for limit in (1, 7, 10, 100):
+        assert page_all(log, limit) == list(range(1, 36))
+    assert page_all(log, 4, severities=["critical"]) == list(range(1, 36, 3))
+    assert page_all(log, 4, severities=["info", "escalation"]) == [s for s in range(1, 36) if s % 3 != 1]
+    assert page_all(log, 3, sensor="soil") == list(range(2, 36, 2))
+
+
+def test_newest_page_and_caught_up_cursor(db):
+    log = EventLog(db, memory_events=10, spill_batch=5)
+    fill(log, 20)
+    events, next_seq = log.after(None, limit=5)
+    assert [e["seq"] for e in events] == [16, 17, 18, 19, 20] and next_seq == 20
+    assert log.after(20) == ([], 20)
+
+
+def test_sequence_continues_after_a_restart(db):
+    log = EventLog(db, memory_events=5, spill_batch=5)
+    fill(log, 12)
+    log.flush()
+    restarted = EventLog(db, memory_events=5, spill_batch=5)
+    assert restarted.append("after restart", "body")["seq"] == 13
+    assert page_all(restarted, 5) == list(range(1, 14))
+
+
+class BrokenConnection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def executemany(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_failed_spill_keeps_events_in_memory(db, monkeypatch):
+    log = EventLog(db, memory_events=5, spill_batch=5)
+    fill(log, 20)
+    working = log._connect
+    monkeypatch.setattr(log, "_connect", BrokenConnection)
+    assert log.flush() is None
+    snapshot = log.snapshot()
+    assert snapshot["spill_errors"] == 1
+    # Nothing reached the disk, so nothing may be evicted
+    assert snapshot["in_memory"] == 20 and snapshot["unspilled"] == 20
+    assert page_all(log, 7) == list(range(1, 21))
+
+    monkeypatch.setattr(log, "_connect", working)
+    log.flush()
+    snapshot = log.snapshot()
+    assert snapshot["in_memory"] == 5 and snapshot["unspilled"] == 0 and snapshot["spilled"] == 20
+    assert page_all(log, 7) == list(range(1, 21))
+
+
+def test_memory_stays_bounded_while_the_disk_is_down(db, monkeypatch):
+    log = EventLog(db, memory_events=5, spill_batch=5, max_memory_events=50)
+    monkeypatch.setattr(log, "_connect", BrokenConnection)
+    fill(log, 80)
+    snapshot = log.snapshot()
+    assert snapshot["in_memory"] == 50 and snapshot["lost"] == 30
+
+
+def test_background_writer_spills_and_evicts(db):
+    log = EventLog(db, memory_events=5, spill_batch=5, flush_interval_s=0.01)
+    evicted = []
+    log.on_evict = evicted.append
+    log.start()
+    fill(log, 30)
+    deadline = time.time() + 5
+    while log.snapshot()["unspilled"] and time.time() < deadline:
+        time.sleep(0.01)
+    # Eviction runs right after the spill; give it a moment too
+    while log.snapshot()["in_memory"] > 5 and time.time() < deadline:
+        time.sleep(0.01)
+    assert log.snapshot()["unspilled"] == 0
+    assert log.snapshot()["in_memory"] == 5
+    assert evicted and evicted[-1] == 25
+
+
+def test_web_worker_keeps_events_until_ingestion_evicts_them(db):
+    ingestion = EventLog(db, memory_events=10, spill_batch=5)
+    worker = EventLog(db, memory_events=10, spill_batch=5, writable=False)
+    ingestion.on_evict = worker.evict_through
+    for i in range(40):
+        worker.add(ingestion.append(f"alert {i}", "body", "critical", ts=1_700_000_000.0 + i))
+        # Nothing is on disk yet, so the worker must still serve every event from memory
+        assert page_all(worker, 16) == list(range(1, i + 2))
+    ingestion.flush()
+    assert worker.snapshot()["in_memory"] == 10
+    assert page_all(worker, 16) == list(range(1, 41))
+
+
+def test_prune_drops_rows_past_retention(db):
+    log = EventLog(db, memory_events=5, spill_batch=5, retention_s=3600)
+    old = time.time() - 7200
+    for i in range(10):
+        log.append(f"alert {i}", "body", ts=old if i < 4 else time.time())
+    log.flush()
+    log._prune()
+    assert log.snapshot()["pruned"] == 4
+    assert page_all(log, 3) == list(range(5, 11))
+
+
+def test_tables_from_before_undelivered_are_upgraded(db):
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE notifications (seq INTEGER PRIMARY KEY, ts REAL NOT NULL,"
+                 " device TEXT, sensor TEXT, severity TEXT, title TEXT, body TEXT)")
+    conn.execute("INSERT INTO notifications VALUES (1, 1.0, 'alpha', 'smoke', 'critical', 'Smoke', 'body')")
+    conn.commit()
+    conn.close()
+    log = EventLog(db, memory_events=0)
+    log.append("Flame", "body", undelivered=True)
+    log.flush()
+    assert [(e["seq"], e["undelivered"]) for e in log.after(0)[0]] == [(1, False), (2, True)]
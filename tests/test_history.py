@@ -0,0 +1,85 @@
+import pytest
+
+from history import HistoryStore
+
+T0 = 1_699_999_200  # on a whole hour
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.db"))
+
+
+def write(store, rows):
+    """Commits rows of (ts, device, soil, smoke, ldr, flame) as one batch, like the writer thread."""
+    conn = store._connect()
+    store._write_batch(conn, rows)
+    conn.close()
+
+
+def rollup(store, width, sensor, bucket, device="alpha"):
+    return store._reader().execute(
+        "SELECT min, max, sum, count FROM rollups WHERE resolution = ? AND device = ? AND sensor = ? AND bucket = ?",
+        (width, device, sensor, bucket),
+    ).fetchone()
+
+
+def test_rollups_merge_across_batches(store):
+    write(store, [(T0 + 0.2, "alpha", 800, 120, 500, 1), (T0 + 0.7, "alpha", 780, 300, 500, 1)])
+    # Same second, minute and hour as the first batch: the buckets are upserted, not replaced
+    write(store, [(T0 + 0.9, "alpha", 790, 90, 500, 0)])
+    assert rollup(store, 1, "smoke", T0) == (90, 300, 510, 3)
+    assert rollup(store, 60, "smoke", T0) == (90, 300, 510, 3)
+    assert rollup(store, 3600, "flame", T0) == (0, 1, 2, 3)
+    write(store, [(T0 + 1.5, "alpha", 800, 400, 500, 1)])
+    assert rollup(store, 1, "smoke", T0 + 1) == (400, 400, 400, 1)
+    assert rollup(store, 60, "smoke", T0) == (90, 400, 910, 4)
+
+
+def test_rollups_are_kept_per_device(store):
+    write(store, [(T0, "alpha", 800, 100, 500, 1), (T0, "beta", 800, 300, 500, 1)])
+    assert rollup(store, 1, "smoke", T0, "alpha") == (100, 100, 100, 1)
+    assert rollup(store, 1, "smoke", T0, "beta") == (300, 300, 300, 1)
+
+
+@pytest.mark.parametrize("span_s,expected", [
+    (10, "1s"), (1000, "1s"), (1001, "1m"), (60000, "1m"), (60001, "1h"), (365 * 86400, "1h"),
+])
+def test_pick_resolution_stays_under_max_points(span_s, expected):
+    assert HistoryStore.pick_resolution(T0, T0 + span_s) == expected
+
+
+def test_query_raw_and_rollups(store):
+    write(store, [(T0 + i * 0.5, "alpha", 800, 100 + i, 500, 1) for i in range(240)]
+          + [(T0 + i * 0.5, "beta", 800, 900, 500, 1) for i in range(240)])
+
+    resolution, points = store.query("smoke", T0, T0 + 2, "raw", device="alpha")
+    assert resolution == "raw"
+    assert [p["value"] for p in points] == [100, 101, 102, 103, 104]
+
+    resolution, points = store.query("smoke", T0, T0 + 119, "auto", device="alpha")
+    assert resolution == "1s" and len(points) == 120
+    assert points[0] == {"t": T0, "min": 100, "max": 101, "mean": 100.5}
+
+    resolution, points = store.query("smoke", T0, T0 + 119, "1m", device="alpha")
+    assert [p["t"] for p in points] == [T0, T0 + 60]
+    assert points[1]["min"] == 220 and points[1]["max"] == 339
+
+    # Without a device, buckets combine every device
+    _, points = store.query("smoke", T0, T0 + 119, "1m")
+    assert points[0]["max"] == 900 and points[0]["mean"] == pytest.approx((sum(range(100, 220)) + 900 * 120) / 240)
+
+
+def test_query_rejects_unknown_sensor_and_resolution(store):
+    with pytest.raises(ValueError):
+        store.query("smoke; DROP TABLE readings", T0, T0 + 1)
+    with pytest.raises(ValueError):
+        store.query("smoke", T0, T0 + 1, "5m")
+
+
+def test_readings_for_replay(store):
+    write(store, [(T0 + 1, "alpha", 800, 100, 500, 1), (T0, "alpha", 810, 110, 510, 0),
+                  (T0, "beta", 1, 2, 3, 1)])
+    times, samples = store.readings("alpha", T0, T0 + 10)
+    assert times == [T0, T0 + 1]
+    assert samples == [(810, 110, 510, 0), (800, 100, 500, 1)]
@@ -0,0 +1,214 @@
+import os
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import pytest
+
+import ingest
+from ingest import IngestionEngine
+
+
+def lag_of(engine, device):
+    series = engine.read_lag.snapshot()["series"][device]
+    return series["sum"] / sum(series["counts"])
+
+
+def test_read_lag_counts_queued_bytes_without_moving_timestamps():
+    received = []
+    engine = IngestionEngine({"alpha": "COM5"}, lambda name, ts, values: received.append(ts))
+    device = engine.devices[0]
+    # 9600 baud is 960 bytes/s: two 14-byte lines plus 96 bytes still queued in the driver
+    device.backlog = 96
+    before = time.time()
+    engine._dispatch(device, b"812,130,455,1\n900,100,400,1\n")
+    # Readings carry the time they were read, whatever the estimate says
+    assert len(received) == 2 and all(before <= ts <= time.time() for ts in received)
+    expected = ((14 + 96) + 96) / 2 / 960
+    assert abs(lag_of(engine, "alpha") - expected) < 0.005
+
+
+def test_tcp_bridges_have_no_wire_delay():
+    engine = IngestionEngine({"bridge": "tcp://127.0.0.1:4000"}, lambda *args: None)
+    device = engine.devices[0]
+    assert device.byte_s == 0
+    engine._dispatch(device, b"812,130,455,1\n" * 50)
+    assert lag_of(engine, "bridge") < 0.005
+
+
+# --- End to end: the engine's own thread reading fake ports and local bridges ---
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+needs_pty = pytest.mark.skipif(os.name == "nt", reason="pty-backed fake ports")
+
+
+def wait_for(condition, timeout_s=5):
+    deadline = time.time() + timeout_s
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Collector:
+    def __init__(self):
+        self.readings = defaultdict(list)
+
+    def __call__(self, device, ts, values):
+        self.readings[device].append(values)
+
+
+@pytest.fixture
+def run_engine():
+    engines = []
+
+    def start(devices, **kwargs):
+        collector = Collector()
+        engine = IngestionEngine(devices, collector, poll_s=0.05, **kwargs).start()
+        engines.append(engine)
+        return engine, collector
+
+    yield start
+    for engine in engines:
+        engine.stop()
+
+
+@pytest.fixture
+def fast_reconnect(monkeypatch):
+    monkeypatch.setattr(ingest, "RECONNECT_MIN_S", 0.05)
+
+
+class Bridge:
+    """A local TCP serial bridge: accepts the engine's connections and writes lines to the latest one."""
+
+    def __init__(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = f"tcp://127.0.0.1:{self.server.getsockname()[1]}"
+        self.conn = None
+
+    def accept(self, timeout_s=5):
+        self.server.settimeout(timeout_s)
+        self.conn, _ = self.server.accept()
+
+    def send(self, data):
+        self.conn.sendall(data)
+
+    def close(self):
+        for sock in (self.conn, self.server):
+            if sock is not None:
+                sock.close()
+
+
+@needs_pty
+def test_reads_several_ports_at_once(run_engine):
+    from fake_serial import FakeSerialPort
+    ports = {name: FakeSerialPort() for name in ("alpha", "beta", "gamma")}
+    try:
+        engine, collector = run_engine({name: p.port for name, p in ports.items()})
+        assert wait_for(lambda: all(d.stats["connected"] for d in engine.devices))
+        for i in range(20):
+            for n, port in enumerate(ports.values()):
+                port.write_reading(800 + n, 100 + i, 500, 1)
+        assert wait_for(lambda: all(len(collector.readings[name]) == 20 for name in ports))
+        for n, name in enumerate(ports):
+            assert collector.readings[name] == [(800 + n, 100 + i, 500, 1) for i in range(20)]
+    finally:
+        for port in ports.values():
+            port.close()
+
+
+@needs_pty
+def test_a_dropped_port_does_not_stop_the_others(run_engine, fast_reconnect):
+    from fake_serial import FakeSerialPort
+    alpha, beta = FakeSerialPort(), FakeSerialPort()
+    try:
+        engine, collector = run_engine({"alpha": alpha.port, "beta": beta.port})
+        assert wait_for(lambda: all(d.stats["connected"] for d in engine.devices))
+        alpha.close()
+        assert wait_for(lambda: not engine.devices[0].stats["connected"])
+        beta.write_reading(800, 100, 500, 1)
+        assert wait_for(lambda: collector.readings["beta"] == [(800, 100, 500, 1)])
+    finally:
+        beta.close()
+
+
+def test_tcp_bridge_reconnects_after_it_drops(run_engine, fast_reconnect):
+    bridge = Bridge()
+    try:
+        engine, collector = run_engine({"bridge": bridge.port})
+        bridge.accept()
+        bridge.send(b"812,130,455,1\n")
+        assert wait_for(lambda: collector.readings["bridge"] == [(812, 130, 455, 1)])
+        bridge.conn.close()
+        bridge.accept()
+        bridge.send(b"900,100,400,1\n")
+        assert wait_for(lambda: len(collector.readings["bridge"]) == 2)
+        assert engine.devices[0].stats["reconnects"] == 1
+    finally:
+        bridge.close()
+
+
+def test_hanging_connect_times_out_without_blocking_other_devices(run_engine, monkeypatch):
+    monkeypatch.setattr(ingest, "CONNECT_TIMEOUT_S", 0.3)
+    # A listener that never accepts, with its backlog full, leaves new connects hanging
+    stuck = socket.socket()
+    stuck.bind(("127.0.0.1", 0))
+    stuck.listen(0)
+    address = stuck.getsockname()
+    filler = []
+    for _ in range(2):
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(address)
+        filler.append(sock)
+    time.sleep(0.2)
+    good = Bridge()
+    try:
+        engine, collector = run_engine({"stuck": f"tcp://127.0.0.1:{address[1]}", "good": good.port})
+        good.accept()
+        good.send(b"812,130,455,1\n")
+        assert wait_for(lambda: collector.readings["good"] == [(812, 130, 455, 1)], timeout_s=1)
+        stuck_device = engine.devices[0]
+        assert stuck_device.connecting
+        # After CONNECT_TIMEOUT_S the attempt is abandoned and retried with backoff
+        assert wait_for(lambda: not stuck_device.connecting and stuck_device.conn is None, timeout_s=2)
+    finally:
+        good.close()
+        stuck.close()
+        for sock in filler:
+            sock.close()
+
+
+def test_slow_dns_lookup_does_not_block_other_devices(run_engine, monkeypatch):
+    lookups = threading.Event()
+    real_getaddrinfo = socket.getaddrinfo
+
+    def slow_getaddrinfo(host, *args, **kwargs):
+        if host == "slow.bridge.test":
+            lookups.set()
+            time.sleep(1.5)
+            host = "127.0.0.1"
+        return real_getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", slow_getaddrinfo)
+    slow, good = Bridge(), Bridge()
+    slow_port = "tcp://slow.bridge.test:" + slow.port.rpartition(":")[2]
+    try:
+        engine, collector = run_engine({"slow": slow_port, "good": good.port})
+        assert lookups.wait(2)
+        good.accept()
+        good.send(b"812,130,455,1\n")
+        # Read while the other device's lookup is still in progress
+        assert wait_for(lambda: collector.readings["good"] == [(812, 130, 455, 1)], timeout_s=1)
+        assert not engine.devices[0].stats["connected"]
+        slow.accept()
+        slow.send(b"900,100,400,1\n")
+        assert wait_for(lambda: collector.readings["slow"] == [(900, 100, 400, 1)])
+    finally:
+        slow.close()
+        good.close()
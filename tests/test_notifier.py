@@ -0,0 +1,108 @@
+import threading
+import time
+
+from events import EventLog
+from notifier import COALESCED, DROPPED, QUEUED, NotificationDispatcher
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ""
+
+
+class StandInSession:
+    """Answers every push with `status`, optionally waiting on `gate` first."""
+
+    def __init__(self, status=200, gate=None):
+        self.status = status
+        self.gate = gate
+        self.posts = []
+        self.sending = threading.Event()
+
+    def post(self, url, json, timeout):
+        self.sending.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.posts.append(json)
+        return Response(self.status)
+
+
+def dispatcher(max_queue=10, workers=1, session=None):
+    d = NotificationDispatcher("http://pushbullet.invalid/v2/pushes", {}, workers=workers, max_queue=max_queue,
+                               retries=0, backoff_s=0)
+    d.session = session or StandInSession()
+    return d
+
+
+def test_identical_alerts_still_queued_are_coalesced():
+    d = dispatcher()
+    assert d.submit("Smoke", "Smoke 250") == QUEUED
+    assert d.submit("Smoke", "Smoke 250") == COALESCED
+    # Same title, different body: a different alert
+    assert d.submit("Smoke", "Smoke 300") == QUEUED
+    d.start().join()
+    assert [p["body"] for p in d.session.posts] == ["Smoke 250", "Smoke 300"]
+    stats = d.snapshot()
+    assert stats["enqueued"] == 2 and stats["coalesced"] == 1 and stats["sent"] == 2
+    # Once delivered, the same alert is a new notification again
+    assert d.submit("Smoke", "Smoke 250") == QUEUED
+
+
+def test_alert_being_sent_is_not_coalesced():
+    gate = threading.Event()
+    d = dispatcher(session=StandInSession(gate=gate)).start()
+    d.submit("Flame", "Fire")
+    assert d.session.sending.wait(5)
+    # The worker has taken it off the queue, so a repeat is queued rather than merged
+    assert d.submit("Flame", "Fire") == QUEUED
+    gate.set()
+    d.join()
+    assert len(d.session.posts) == 2
+
+
+def test_full_queue_drops_and_forgets_the_alert():
+    d = dispatcher(max_queue=1)
+    assert d.submit("A", "a") == QUEUED
+    assert d.submit("B", "b") == DROPPED
+    assert d.snapshot()["dropped"] == 1
+    d.start().join()
+    # A dropped alert is not left in the pending set, so it can be queued later
+    assert d.submit("B", "b") == QUEUED
+
+
+def test_dropped_alerts_are_still_logged_as_undelivered(app_module, tmp_path, monkeypatch):
+    log = EventLog(str(tmp_path / "history.db"), memory_events=0)
+    monkeypatch.setattr(app_module, "notification_log", log)
+    monkeypatch.setattr(app_module, "notifier", dispatcher(max_queue=1))
+    app_module.send_pushbullet_notification("Smoke", "Smoke 250", "critical")
+    app_module.send_pushbullet_notification("Smoke", "Smoke 250", "critical")
+    app_module.send_pushbullet_notification("Flame", "Fire", "critical")
+    events = log.tail()
+    # The coalesced duplicate is not logged; the dropped one is, flagged
+    assert [(e["title"], e["undelivered"]) for e in events] == [("Smoke", False), ("Flame", True)]
+    # Read back from disk once spilled
+    log.flush()
+    assert log.snapshot()["in_memory"] == 0
+    assert [e["undelivered"] for e in log.after(0)[0]] == [False, True]
+
+
+def test_failing_delivery_hook_does_not_kill_the_worker():
+    d = dispatcher(workers=1)
+    delivered = []
+
+    def hook(title, severity, origin, ok):
+        delivered.append(title)
+        raise RuntimeError("broken hook")
+
+    d.on_delivered = hook
+    d.start()
+    d.submit("A", "a")
+    d.join()
+    # The only worker survived the first hook error and delivers the next one too
+    d.submit("B", "b")
+    deadline = time.time() + 5
+    while len(delivered) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert delivered == ["A", "B"]
+    assert all(worker.is_alive() for worker in d._workers)
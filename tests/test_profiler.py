@@ -0,0 +1,23 @@
+import time
+
+import pytest
+
+from profiler import SamplingProfiler
+
+
+@pytest.mark.parametrize("interval_s", [0, -0.005, float("nan"), float("inf")])
+def test_rejects_intervals_that_would_spin_or_hang(interval_s):
+    profiler = SamplingProfiler()
+    with pytest.raises(ValueError):
+        profiler.start(interval_s)
+    assert not profiler.running
+
+
+def test_samples_other_threads():
+    profiler = SamplingProfiler()
+    assert profiler.start(0.001)
+    assert not profiler.start(0.001)
+    while profiler.samples < 5:
+        time.sleep(0.001)
+    assert profiler.stop()
+    assert "MainThread;" in profiler.collapsed()
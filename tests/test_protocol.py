@@ -0,0 +1,97 @@
+from ingest import BINARY_PROBE_BYTES, Device
+from protocol import FrameDecoder, crc16, pack_frame, parse_csv_line
+
+SAMPLES = [(512, 120, 300, 1), (1023, 0, 1023, 0), (0, 1023, 0, 1)]
+
+
+def values(readings):
+    return [v for _, v in readings]
+
+
+def test_frame_round_trip_and_sample_timestamps():
+    decoder = FrameDecoder()
+    readings = decoder.feed(pack_frame(7, SAMPLES, 10), now=100.0)
+    assert values(readings) == SAMPLES
+    # The last sample is stamped `now`, earlier ones one interval apart before it
+    assert [round(t, 3) for t, _ in readings] == [99.98, 99.99, 100.0]
+    assert decoder.stats["frames"] == 1 and decoder.stats["samples"] == 3
+
+
+def test_frames_split_across_reads():
+    decoder = FrameDecoder()
+    data = pack_frame(1, SAMPLES, 10) + pack_frame(2, SAMPLES[:1], 10)
+    readings = []
+    for i in range(len(data)):
+        readings += decoder.feed(data[i:i + 1], now=1.0)
+    assert values(readings) == SAMPLES + SAMPLES[:1]
+    assert decoder.stats["corrupt_frames"] == decoder.stats["discarded_bytes"] == 0
+
+
+def test_resync_after_garbage_and_bad_crc():
+    corrupt = bytearray(pack_frame(2, SAMPLES, 10))
+    corrupt[8] ^= 0xFF
+    data = b"noise\xaa" + pack_frame(1, SAMPLES[:1], 10) + bytes(corrupt) + pack_frame(3, SAMPLES[1:], 10)
+    decoder = FrameDecoder()
+    readings = decoder.feed(data, now=1.0)
+    assert values(readings) == SAMPLES[:1] + SAMPLES[1:]
+    assert decoder.stats["corrupt_frames"] >= 1
+    assert decoder.stats["frames"] == 2
+    # The corrupt frame counts as a lost frame once the next good one arrives
+    assert decoder.stats["dropped_frames"] == 1
+
+
+def test_bad_sample_count_is_corrupt():
+    frame = bytearray(pack_frame(1, SAMPLES, 10))
+    frame[4] = 0
+    decoder = FrameDecoder()
+    assert decoder.feed(bytes(frame) + pack_frame(2, SAMPLES[:1], 10), now=1.0) == [(1.0, SAMPLES[0])]
+    assert decoder.stats["corrupt_frames"] == 1
+
+
+def test_sequence_gaps_wraparound_and_restart():
+    decoder = FrameDecoder()
+    for seq in (65534, 65535, 0, 3):
+        decoder.feed(pack_frame(seq, SAMPLES[:1], 10), now=1.0)
+    # 65535 -> 0 is a wrap, 0 -> 3 lost frames 1 and 2
+    assert decoder.stats["dropped_frames"] == 2
+    # Jumping far backwards is the sketch restarting, not 65k lost frames
+    decoder.feed(pack_frame(0, SAMPLES[:1], 10), now=1.0)
+    assert decoder.stats["dropped_frames"] == 2
+
+
+def test_crc_is_ccitt_false():
+    assert crc16(b"123456789") == 0x29B1
+
+
+def test_parse_csv_line():
+    assert parse_csv_line(b"812,130,455,1\r") == (812, 130, 455, 1)
+    assert parse_csv_line(b"812,130,455") is None
+    assert parse_csv_line(b"812,x,455,1") is None
+
+
+def test_device_switches_to_binary_only_after_a_valid_frame():
+    device = Device("alpha", "COM5", 9600)
+    readings = device.decode(b"812,130,455,1\n900,100,400,1\n" + pack_frame(1, SAMPLES, 10)[:9], now=1.0)
+    # CSV lines before the sync byte are parsed; half a frame is not enough to switch
+    assert values(readings) == [(812, 130, 455, 1), (900, 100, 400, 1)]
+    assert device.stats["protocol"] == "csv"
+    readings = device.decode(pack_frame(1, SAMPLES, 10)[9:], now=2.0)
+    assert values(readings) == SAMPLES
+    assert device.stats["protocol"] == "binary"
+    assert device.stats["readings"] == 5
+
+
+def test_stray_sync_byte_leaves_the_port_on_csv():
+    device = Device("alpha", "COM5", 9600)
+    readings = device.decode(b"812,130,455,1\n\xaa\xaa900,100,400,1\n", now=1.0)
+    readings += device.decode(b"901,100,400,1\n", now=1.0)
+    assert values(readings) == [(812, 130, 455, 1), (901, 100, 400, 1)]
+    assert device.stats["parse_errors"] == 1
+
+    line = b"905,100,400,1\n"
+    for _ in range(BINARY_PROBE_BYTES // len(line) + 1):
+        assert values(device.decode(line, now=1.0)) == [(905, 100, 400, 1)]
+    assert device.stats["protocol"] == "csv"
+    assert device.stats["false_syncs"] == 1
+    assert device.probe is None
+
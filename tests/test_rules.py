@@ -0,0 +1,239 @@
+import json
+import os
+import random
+
+import pytest
+
+from rules import CompiledRules, RuleEngine, RuleError
+
+RULES_JSON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules.json")
+
+
+def load_config(raw_sensors=False):
+    with open(RULES_JSON, encoding="utf-8") as f:
+        config = json.load(f)
+    if raw_sensors:
+        # The hand-written checks looked at raw values, before signal conditioning
+        for rule in config["rules"]:
+            rule["sensor"] = rule["sensor"].partition(".")[0]
+    return config
+
+
+class OriginalChecks:
+    """The alert branches app.py had before rules.json, kept as the reference behaviour."""
+
+    NOTIF_DELAY_S = {"soil": 5, "smoke": 0.2, "ldr": 5, "flame": 0.2}
+    CRITICAL_ESCALATION_DELAY_S = 10
+
+    def __init__(self):
+        self.last_notif_time = {"soil": 0, "smoke": 0, "ldr": 0, "flame": 0}
+        self.active_since = {"flame": 0, "smoke": 0, "soil_flood": 0, "ldr_bright": 0}
+        self.escalated = {"flame": False, "smoke": False, "soil_flood": False, "ldr_bright": False}
+
+    def _hazard(self, out, now, active, key, cooldown_key, alert, escalation):
+        if not active:
+            self.active_since[key] = 0
+            return
+        if now - self.last_notif_time[cooldown_key] > self.NOTIF_DELAY_S[cooldown_key]:
+            out.append(alert)
+            self.last_notif_time[cooldown_key] = now
+        if self.active_since[key] == 0:
+            self.active_since[key] = now
+            self.escalated[key] = False
+        elif now - self.active_since[key] > self.CRITICAL_ESCALATION_DELAY_S and not self.escalated[key]:
+            out.append(escalation)
+            self.escalated[key] = True
+
+    def check(self, data, now):
+        out = []
+        self._hazard(out, now, data["flame"] == 0, "flame", "flame", (
+            "(NORMAL)🔥🔥 COMBUSTION EVENT DETECTED!",
+            "Active flame detected in Sector Alpha! Immediately trigger fire suppression system. Evacuate sector now!",
+            "critical"), (
+            "(CRITICAL)🔥🔥 FIRE SPREADING!",
+            "Combustion has not been suppressed for 30 seconds. Structural integrity is compromised. "
+            "Jettison module protocol is now advised.",
+            "escalation"))
+        self._hazard(out, now, data["smoke"] > 200, "smoke", "smoke", (
+            "(NORMAL)☣️ Cabin Air Contamination!",
+            "Unidentified volatile gases detected. Possible electrical short or propellant leak. "
+            f"Advise immediate crew mask deployment. (Smoke: {data['smoke']})",
+            "critical"), (
+            "(CRITICAL)☣️ ATMOSPHERE UNRECOVERABLE!",
+            "Air quality remains critical for 30 seconds. Life support cannot scrub contaminants. "
+            "Seal all hatches and prepare for EVA.",
+            "escalation"))
+
+        soil = data["soil"]
+        self._hazard(out, now, soil < 590, "soil_flood", "soil", (
+            "(NORMAL)‼️ Alert: Fluid Leak Detected!",
+            "High moisture levels detected. Possible coolant line or water reclamation failure. "
+            f"Activate containment protocol. (Soil: {soil})",
+            "critical"), (
+            "(CRITICAL)🚨 CATASTROPHIC FLOODING!",
+            "Fluid leak has been continuous for 30 seconds. Containment failure imminent. "
+            "Immediate EVACUATION of the sector is required!",
+            "escalation"))
+        if soil >= 590 and 400 <= soil < 700 and now - self.last_notif_time["soil"] > self.NOTIF_DELAY_S["soil"]:
+            out.append(("(NORMAL)💧 Atmospheric Condensation Alert",
+                        "Humidity rising in Sector Gamma. Potential condensation on critical systems. "
+                        f"Monitor telemetry. (Soil: {soil})",
+                        "medium"))
+            self.last_notif_time["soil"] = now
+
+        ldr = data["ldr"]
+        self._hazard(out, now, ldr <= 170, "ldr_bright", "ldr", (
+            "(NORMAL)☀️ EXTREME LUMINOSITY EVENT!",
+            "Warning: Light intensity exceeds solar flare predictions. Possible external proximity event "
+            f"or hull breach. AVOID VISUAL EXPOSURE. (LDR: {ldr})",
+            "critical"), (
+            "(CRITICALLLLLLL)☀️ HULL BREACH CONFIRMED!",
+            "Extreme light exposure has been sustained for 30 seconds. Assume hull integrity is compromised. "
+            "All crew to designated safe zones immediately.",
+            "escalation"))
+        if ldr > 170 and ldr > 700 and now - self.last_notif_time["ldr"] > self.NOTIF_DELAY_S["ldr"]:
+            out.append(("(NORMAL)🌑 Orbital Shadow or Power Anomaly",
+                        "Module entering expected orbital shadow. If this is off-schedule, check primary power bus. "
+                        f"Solar arrays show low input. (LDR: {ldr})",
+                        "info"))
+            self.last_notif_time["ldr"] = now
+        return out
+
+
+def random_readings(count, seed):
+    """Readings that wander in and out of every hazard band, with long enough spells to escalate."""
+    rng = random.Random(seed)
+    now = 1_700_000_000.0
+    values = {"soil": 800, "smoke": 120, "ldr": 500, "flame": 1}
+    for _ in range(count):
+        now += rng.choice((0.05, 0.1, 0.5, 1.0, 2.0))
+        if rng.random() < 0.05:
+            values = {"soil": rng.randint(300, 900), "smoke": rng.randint(50, 400),
+                      "ldr": rng.randint(50, 900), "flame": rng.choice((0, 1, 1, 1))}
+        yield now, {k: v + rng.randint(-5, 5) * (k != "flame") for k, v in values.items()}
+
+
+def test_rules_json_matches_the_original_checks():
+    rules = CompiledRules(load_config(raw_sensors=True))
+    state = rules.new_state()
+    reference = OriginalChecks()
+    raised = 0
+    for now, reading in random_readings(20000, seed=7):
+        expected = reference.check(reading, now)
+        got = [out[:3] for out in rules.evaluate(state, reading, now)]
+        assert got == expected, (now, reading)
+        raised += len(got)
+    # Make sure the trace actually exercised the rules, escalations included
+    assert raised > 1000
+
+
+def single_rule(**overrides):
+    rule = {"id": "smoke", "sensor": "smoke", "op": ">", "threshold": 200,
+            "title": "Smoke", "body": "Smoke {value} on {device}", "severity": "critical"}
+    rule.update(overrides)
+    return CompiledRules({"rules": [rule]})
+
+
+def run(rules, steps, device="alpha"):
+    """Feeds (seconds, smoke) steps through `rules`; returns {seconds: [titles raised]}."""
+    state = rules.new_state()
+    start = 1_700_000_000.0
+    return {t: [out[0] for out in rules.evaluate(state, {"smoke": value}, start + t, device)]
+            for t, value in steps}
+
+
+def test_message_formatting_and_sensor_name():
+    rules = CompiledRules({"rules": [{"id": "s", "sensor": "smoke.median", "op": ">", "threshold": 200,
+                                      "title": "Smoke", "body": "{value} at {device}"}]})
+    state = rules.new_state()
+    assert rules.evaluate(state, {"smoke.median": 250.0}, 1.0, "beta") == [("Smoke", "250 at beta", "info", "smoke")]
+
+
+def test_hysteresis_keeps_a_rule_active_until_it_crosses_clear():
+    escalation = {"title": "Still smoky", "after_s": 5}
+    with_clear = run(single_rule(clear=150, escalation=escalation), [(0, 250), (3, 180), (6, 180)])
+    without = run(single_rule(escalation=escalation), [(0, 250), (3, 180), (6, 250), (12, 250)])
+    # 180 is below the threshold but above `clear`, so the hazard never ended
+    assert "Still smoky" in with_clear[6]
+    # Without hysteresis 180 clears it and the escalation timer starts over at 6
+    assert "Still smoky" not in without[6]
+    assert "Still smoky" in without[12]
+    assert run(single_rule(clear=150), [(0, 250), (3, 140), (4, 180)])[4] == []
+
+
+def test_debounce_requires_the_condition_to_hold():
+    rules = single_rule(debounce_s=2)
+    raised = run(rules, [(0, 250), (1, 250), (2.5, 250), (3, 100), (4, 250), (5, 250), (6.5, 250)])
+    assert raised[0] == raised[1] == []
+    assert raised[2.5] == ["Smoke"]
+    # Dropping out resets the debounce timer
+    assert raised[4] == raised[5] == []
+    assert raised[6.5] == ["Smoke"]
+
+
+def test_cooldown_limits_repeats():
+    rules = CompiledRules({"cooldowns_s": {"smoke": 10}, "rules": [
+        {"id": "smoke", "sensor": "smoke", "op": ">", "threshold": 200, "cooldown": "smoke", "title": "Smoke"}]})
+    raised = run(rules, [(0, 250), (5, 250), (11, 250)])
+    assert raised == {0: ["Smoke"], 5: [], 11: ["Smoke"]}
+
+
+def test_escalation_fires_once_per_episode():
+    rules = single_rule(escalation={"title": "Escalated", "after_s": 5})
+    raised = run(rules, [(0, 250), (4, 250), (6, 250), (7, 250), (8, 100), (9, 250), (15, 250)])
+    assert "Escalated" not in raised[4]
+    assert "Escalated" in raised[6]
+    assert "Escalated" not in raised[7]
+    # A new episode after the value cleared escalates again
+    assert "Escalated" in raised[15]
+
+
+def test_unless_suppresses_while_the_earlier_rule_is_active():
+    rules = CompiledRules({"rules": [
+        {"id": "flood", "sensor": "soil", "op": "<", "threshold": 590, "title": "Flood"},
+        {"id": "damp", "sensor": "soil", "op": "between", "threshold": [400, 700], "unless": "flood",
+         "title": "Damp"},
+    ]})
+    state = rules.new_state()
+    assert [o[0] for o in rules.evaluate(state, {"soil": 500}, 1.0)] == ["Flood"]
+    assert [o[0] for o in rules.evaluate(state, {"soil": 650}, 2.0)] == ["Damp"]
+
+
+@pytest.mark.parametrize("overrides", [
+    {"sensor": "smoke.medain"},
+    {"sensor": "smog"},
+    {"threshold": "200"},
+    {"threshold": True},
+    {"clear": "150"},
+    {"op": "between", "threshold": [400, "700"]},
+    {"op": "~"},
+    {"escalation": "call the captain"},
+    {"escalation": {"body": "no title", "after_s": 5}},
+    {"escalation": {"title": "Late", "after_s": "soon"}},
+    {"escalation": {"title": "No delay"}},
+    {"debounce_s": -1},
+    {"body": "Smoke {valeu}"},
+    {"title": 5},
+    {"severity": ["critical"]},
+])
+def test_invalid_rules_are_rejected_at_compile_time(overrides):
+    with pytest.raises(RuleError):
+        single_rule(**overrides)
+
+
+def test_broken_rule_file_keeps_the_previous_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(load_config()), encoding="utf-8")
+    engine = RuleEngine(str(path))
+    assert engine.version == 1
+
+    for broken in ({"sensor": "smoke.medain"}, {"threshold": "200"}, {"escalation": "soon"}):
+        config = load_config()
+        config["rules"][1].update(broken)
+        path.write_text(json.dumps(config), encoding="utf-8")
+        assert engine.reload() is False
+        assert engine.version == 1
+
+    signals = {"soil": 800, "smoke": 120, "ldr": 500, "flame": 0}
+    signals.update({f"{s}.median": v for s, v in list(signals.items())})
+    assert [out[0] for out in engine.evaluate("alpha", signals, 1000.0)] == ["(NORMAL)🔥🔥 COMBUSTION EVENT DETECTED!"]
@@ -0,0 +1,88 @@
+"""Measures how ingestion throughput and CPU scale with the number of devices.
+
+Each device is a pty-backed fake serial port fed by a separate writer process,
+so the CPU time reported is the ingestion engine's alone (Linux/macOS only):
+
+    python tools/bench_ingest.py --devices 1 10 50 100 --rate 50 --seconds 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import IngestionEngine  # noqa: E402
+from fake_serial import FakeSerialPort  # noqa: E402
+
+
+def feed(ports, rate, seconds):
+    """Writer process: sends `rate` lines per second to every port (0 = flat out)."""
+    line = b"812,143,455,1\n"
+    interval = 1 / rate if rate else 0
+    deadline = time.monotonic() + seconds
+    next_at = time.monotonic()
+    while time.monotonic() < deadline:
+        for p in ports:
+            try:
+                p.write(line)
+            except OSError:
+                return
+        if interval:
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def run(n_devices, rate, seconds):
+    ports = [FakeSerialPort() for _ in range(n_devices)]
+    received = [0]
+
+    def on_reading(device, ts, values):
+        received[0] += 1
+
+    engine = IngestionEngine({f"dev{i}": p.port for i, p in enumerate(ports)}, on_reading, poll_s=0.1)
+    engine.start()
+    time.sleep(0.5)  # let every port open
+
+    pid = os.fork()
+    if pid == 0:
+        feed(ports, rate, seconds)
+        os._exit(0)
+
+    wall0, cpu0 = time.monotonic(), time.process_time()
+    os.waitpid(pid, 0)
+    time.sleep(0.2)  # drain what is still buffered
+    wall, cpu = time.monotonic() - wall0, time.process_time() - cpu0
+
+    engine.stop()
+    time.sleep(0.2)
+    for p in ports:
+        p.close()
+
+    expected = n_devices * rate * seconds if rate else None
+    return {
+        "devices": n_devices,
+        "lines_per_s": received[0] / wall,
+        "cpu_pct": 100 * cpu / wall,
+        "delivered_pct": 100 * received[0] / expected if expected else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 25, 50, 100])
+    parser.add_argument("--rate", type=float, default=50, help="lines/s per device, 0 = as fast as possible")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{'devices':>8} {'lines/s':>10} {'cpu %':>7} {'delivered %':>12}")
+    for n in args.devices:
+        r = run(n, args.rate, args.seconds)
+        delivered = f"{r['delivered_pct']:.1f}" if r["delivered_pct"] is not None else "-"
+        print(f"{r['devices']:>8} {r['lines_per_s']:>10.0f} {r['cpu_pct']:>7.1f} {delivered:>12}")
+
+
+if __name__ == "__main__":
+    main()
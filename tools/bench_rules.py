@@ -0,0 +1,81 @@
+"""Measures how many readings per second one core conditions and evaluates against the hazard rules.
+
+Conditioning (SignalConditioner.update, one per reading) and rule
+evaluation are timed separately, since every live reading pays for both.
+The batched conditioning used by `tools/replay.py --offline` is timed too.
+
+    python tools/bench_rules.py --devices 100 --readings 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rules import RuleEngine  # noqa: E402
+from conditioning import SignalConditioner  # noqa: E402
+
+NOMINAL = (800, 120, 500, 1)
+HAZARD = (450, 350, 150, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", default=os.path.join(ROOT, "rules.json"))
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--window", type=int, default=16, help="conditioning window, as SIGNAL_WINDOW in app.py")
+    parser.add_argument("--hazard-rate", type=float, default=0.05,
+                        help="fraction of readings that trip at least one rule")
+    args = parser.parse_args()
+
+    engine = RuleEngine(args.rules)
+    random.seed(0)
+    now = time.time()
+    readings = [
+        (f"dev{random.randrange(args.devices)}", now + i * 0.01,
+         tuple(v + random.randint(-5, 5) * (k < 3) for k, v in
+               enumerate(HAZARD if random.random() < args.hazard_rate else NOMINAL)))
+        for i in range(args.readings)
+    ]
+
+    conditioners = {}
+    signals = []
+    started = time.perf_counter()
+    for device, ts, values in readings:
+        conditioner = conditioners.get(device)
+        if conditioner is None:
+            conditioner = conditioners[device] = SignalConditioner(window=args.window)
+        signals.append(conditioner.update(ts, values))
+    conditioning_s = time.perf_counter() - started
+
+    raised = 0
+    started = time.perf_counter()
+    for (device, ts, _), reading in zip(readings, signals):
+        raised += len(engine.evaluate(device, reading, ts))
+    rules_s = time.perf_counter() - started
+
+    per_device = {}
+    for device, ts, values in readings:
+        per_device.setdefault(device, ([], []))
+        per_device[device][0].append(ts)
+        per_device[device][1].append(values)
+    started = time.perf_counter()
+    for times, samples in per_device.values():
+        SignalConditioner(window=args.window).condition_batch(times, samples)
+    batch_s = time.perf_counter() - started
+
+    n = args.readings
+    total = conditioning_s + rules_s
+    print(f"{n} readings over {args.devices} devices, {len(engine.ruleset.rules)} rules")
+    print(f"  conditioning      {1e6 * conditioning_s / n:6.2f} µs/reading")
+    print(f"  rules             {1e6 * rules_s / n:6.2f} µs/reading, {raised} notifications raised")
+    print(f"  total             {1e6 * total / n:6.2f} µs/reading, {n / total:,.0f} readings/s on one core")
+    print(f"  batched           {1e6 * batch_s / n:6.2f} µs/reading conditioning, as replay --offline does")
+
+
+if __name__ == "__main__":
+    main()
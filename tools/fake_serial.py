@@ -0,0 +1,70 @@
+"""Pseudo-terminal backed stand-ins for the Arduino serial port (Linux/macOS).
+
+Run it directly to get a port the server can open:
+
+    python tools/fake_serial.py --devices 3 --rate 1
+    HAZARD_DEVICES="alpha=/dev/pts/5,beta=/dev/pts/6,gamma=/dev/pts/7" python app.py
+"""
+import argparse
+import os
+import random
+import time
+import tty
+
+
+class FakeSerialPort:
+    """A pty pair: the server opens `.port`, the test writes to the master side."""
+
+    def __init__(self):
+        self.master, self.slave = os.openpty()
+        # Raw mode so the line discipline doesn't echo or translate newlines
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def write(self, data):
+        os.write(self.master, data)
+
+    def write_reading(self, soil, smoke, ldr, flame):
+        self.write(f"{soil},{smoke},{ldr},{flame}\n".encode())
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def random_reading():
+    """A mostly nominal reading, with the occasional hazard."""
+    return (
+        random.randint(600, 1000) if random.random() > 0.05 else random.randint(200, 590),
+        random.randint(50, 180) if random.random() > 0.05 else random.randint(201, 600),
+        random.randint(300, 700),
+        0 if random.random() < 0.01 else 1,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1, help="number of fake ports")
+    parser.add_argument("--rate", type=float, default=1.0, help="readings per second per port")
+    args = parser.parse_args()
+
+    ports = [FakeSerialPort() for _ in range(args.devices)]
+    spec = ",".join(f"sector{i}={p.port}" for i, p in enumerate(ports))
+    print(f'HAZARD_DEVICES="{spec}"', flush=True)
+    try:
+        while True:
+            for p in ports:
+                p.write_reading(*random_reading())
+            time.sleep(1 / args.rate)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in ports:
+            p.close()
+
+
+if __name__ == "__main__":
+    main()
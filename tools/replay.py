@@ -0,0 +1,345 @@
+"""Replays sensor traces through the full pipeline without hardware or a Pushbullet account.
+
+Lines are written to pty-backed fake serial ports and read by the real
+ingestion engine. From there they go through conditioning, the rule engine
+and the notification dispatcher, which posts to a local stand-in for the
+Pushbullet API. The report covers serial-to-parse latency, serial-to-
+notification latency, dropped readings and the achieved rate (Linux/macOS).
+
+    python tools/replay.py --devices 4 --rate 20 --duration 10
+    python tools/replay.py --trace recording.csv --speed 10
+    python tools/replay.py --devices 10 --find-max
+    python tools/replay.py --history history.db --offline
+
+--offline skips the ports and the notifier: each device's trace is
+conditioned in one vectorized pass (SignalConditioner.signals_batch) and
+run through the rules as fast as they evaluate, which is the quick way to
+see what a rules.json change would have raised over a recorded history.
+
+A trace is a CSV file with a header row: t,soil,smoke,ldr,flame and an
+optional device column. t is in seconds (epoch or relative). --history
+reads the readings straight from a `history.db` instead; they can also be
+exported with:
+
+    sqlite3 -header -csv history.db "SELECT ts AS t, device, soil, smoke, ldr, flame FROM readings ORDER BY ts"
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from conditioning import SignalConditioner  # noqa: E402
+from fake_serial import FakeSerialPort  # noqa: E402
+from rules import RuleEngine  # noqa: E402
+
+
+class StandInPushbullet:
+    """Local HTTP server that accepts Pushbullet pushes and records them."""
+
+    def __init__(self, delay_s=0.0, fail_rate=0.0):
+        received = self.received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if delay_s:
+                    time.sleep(delay_s)
+                if random.random() < fail_rate:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                received.append((time.time(), payload.get("title")))
+                body = b'{"active": true}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v2/pushes"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def load_trace(path):
+    """Reads a CSV trace into {device: [(t, (soil, smoke, ldr, flame)), ...]}."""
+    traces = defaultdict(list)
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            values = tuple(int(float(row[k])) for k in ("soil", "smoke", "ldr", "flame"))
+            traces[row.get("device") or "replay"].append((float(row["t"]), values))
+    for rows in traces.values():
+        rows.sort()
+    return dict(traces)
+
+
+def load_history(path, device=None):
+    """Reads the raw readings of a history.db, in the same shape as load_trace."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    query, args = "SELECT device, ts, soil, smoke, ldr, flame FROM readings", ()
+    if device:
+        query, args = query + " WHERE device = ?", (device,)
+    traces = defaultdict(list)
+    for name, ts, *values in conn.execute(query + " ORDER BY device, ts", args):
+        traces[name].append((ts, tuple(values)))
+    conn.close()
+    return dict(traces)
+
+
+def synthetic_trace(devices, rate, duration, seed=0):
+    """Nominal readings with hazard episodes long enough to trip alerts and escalations."""
+    rng = random.Random(seed)
+    step = 1 / rate
+    hazards = {0: ("soil", 450), 1: ("smoke", 420), 2: ("ldr", 120), 3: ("flame", 0)}
+    traces = {}
+    for d in range(devices):
+        rows, episode_left, episode = [], 0, None
+        for i in range(int(duration * rate)):
+            values = [rng.randint(700, 900), rng.randint(80, 160), rng.randint(300, 650), 1]
+            if episode_left == 0 and rng.random() < 0.02:
+                episode, episode_left = rng.randrange(4), rng.randint(int(3 * rate), int(15 * rate))
+            if episode_left:
+                values[episode] = hazards[episode][1] + rng.randint(-10, 10) * (episode != 3)
+                episode_left -= 1
+            elif rng.random() < 0.01:
+                values[1] = 900  # lone ADC spike, should be filtered out
+            rows.append((i * step, tuple(values)))
+        traces[f"sector{d}"] = rows
+    return traces
+
+
+def percentiles(samples):
+    if not samples:
+        return "n/a"
+    s = sorted(samples)
+
+    def pick(p):
+        return s[min(len(s) - 1, int(p / 100 * len(s)))] * 1000
+
+    return f"p50 {pick(50):.1f} ms  p95 {pick(95):.1f} ms  p99 {pick(99):.1f} ms  max {s[-1] * 1000:.1f} ms"
+
+
+class Harness:
+    """Runs the app's pipeline in-process against fake ports and the stand-in server."""
+
+    def __init__(self, device_names, api_delay_s=0.0, api_fail_rate=0.0):
+        self.api = StandInPushbullet(api_delay_s, api_fail_rate)
+        self.ports = {name: FakeSerialPort() for name in device_names}
+
+        os.environ["PUSHBULLET_API_URL"] = self.api.url
+        os.environ.setdefault("API_KEY", "replay")
+        os.environ.setdefault("HAZARD_LOG_LEVEL", "WARNING")
+        os.environ["HAZARD_DEVICES"] = ",".join(f"{n}={p.port}" for n, p in self.ports.items())
+        self.tmp = tempfile.TemporaryDirectory()
+        os.environ["HAZARD_HISTORY_DB"] = os.path.join(self.tmp.name, "history.db")
+
+        import app
+        self.app = app
+
+        self.lock = threading.Lock()
+        self.written = {}                     # device -> [write time of each line]
+        self.parsed = defaultdict(list)       # device -> [read time, ...]
+        self.line_written_at = {}             # read time -> write time of its earliest line
+        self.deliveries = []                  # (origin, done time, ok)
+        on_reading = app.ingestion.on_reading
+
+        def record_reading(device, ts, values):
+            # Lines arrive in order, so the k-th reading is the k-th line written
+            parsed = self.parsed[device]
+            written = self.written.get(device, ())
+            if len(parsed) < len(written):
+                w = written[len(parsed)]
+                self.line_written_at[ts] = min(w, self.line_written_at.get(ts, w))
+            parsed.append(ts)
+            on_reading(device, ts, values)
+
+        def record_delivery(title, severity, origin, ok):
+            with self.lock:
+                self.deliveries.append((origin, time.time(), ok))
+
+        app.ingestion.on_reading = record_reading
+        app.notifier.on_delivered = record_delivery
+        app.notifier.start()
+        app.history.start()
+        app.ingestion.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if all(d["connected"] for d in app.ingestion.snapshot().values()):
+                break
+            time.sleep(0.05)
+
+    def run(self, traces, speed=1.0):
+        """Writes every trace in real time / `speed` and returns the measurements."""
+        for rows in self.parsed.values():
+            rows.clear()
+        self.deliveries.clear()
+        self.line_written_at.clear()
+        written = self.written = {name: [] for name in traces}
+
+        def writer(name, rows):
+            port = self.ports[name]
+            t0 = rows[0][0] if rows else 0
+            start = time.monotonic()
+            stamps = written[name]
+            for t, (soil, smoke, ldr, flame) in rows:
+                delay = (t - t0) / speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                stamps.append(time.time())
+                port.write_reading(soil, smoke, ldr, flame)
+
+        threads = [threading.Thread(target=writer, args=(n, r), daemon=True) for n, r in traces.items()]
+        started = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - started
+        time.sleep(1.0)  # let the engine and dispatcher drain
+        self.app.notifier.join()
+        return self._measure(traces, written, elapsed)
+
+    def _measure(self, traces, written, elapsed):
+        lines = sum(len(w) for w in written.values())
+        parsed = sum(len(self.parsed[name]) for name in traces)
+        parse_lag = []
+        for name, stamps in written.items():
+            for w, r in zip(stamps, self.parsed[name]):
+                parse_lag.append(r - w)
+
+        e2e = [done - self.line_written_at[origin]
+               for origin, done, ok in self.deliveries
+               if ok and origin in self.line_written_at]
+
+        target = sum(len(r) for r in traces.values())
+        return {
+            "lines_written": lines,
+            "readings_parsed": parsed,
+            "dropped": lines - parsed,
+            "achieved_rate": lines / elapsed if elapsed else 0.0,
+            "target_rate": target / elapsed if elapsed else 0.0,
+            "parse_lag": parse_lag,
+            "e2e": e2e,
+            "notifier": self.app.notifier.snapshot(),
+            "api_received": len(self.api.received),
+            "elapsed": elapsed,
+        }
+
+
+def evaluate_offline(traces, rules_path, window):
+    """Conditions each trace in one batch and evaluates the rules over it, with no ports or notifier."""
+    engine = RuleEngine(rules_path)
+    raised = Counter()
+    conditioning_s = rules_s = 0.0
+    for device, rows in traces.items():
+        times = [t for t, _ in rows]
+        samples = [values for _, values in rows]
+        started = time.perf_counter()
+        signals = SignalConditioner(window=window).signals_batch(times, samples)
+        conditioned = time.perf_counter()
+        for ts, reading in zip(times, signals):
+            for title, _, severity, _ in engine.evaluate(device, reading, ts):
+                raised[severity, title] += 1
+        rules_s += time.perf_counter() - conditioned
+        conditioning_s += conditioned - started
+
+    total = sum(len(rows) for rows in traces.values()) or 1
+    print(f"  conditioning      {1e6 * conditioning_s / total:.2f} µs/reading (batched)")
+    print(f"  rules             {1e6 * rules_s / total:.2f} µs/reading")
+    print(f"  notifications     {sum(raised.values())} raised")
+    for (severity, title), count in raised.most_common():
+        print(f"    {count:>7}  {severity:<10} {title}")
+
+
+def report(r):
+    n = r["notifier"]
+    print(f"  lines written     {r['lines_written']}  ({r['achieved_rate']:.0f}/s over {r['elapsed']:.1f} s)")
+    print(f"  readings parsed   {r['readings_parsed']}  (dropped {r['dropped']})")
+    print(f"  serial -> parse   {percentiles(r['parse_lag'])}")
+    print(f"  serial -> notify  {percentiles(r['e2e'])}")
+    print(f"  notifications     queued {n['enqueued']}, coalesced {n['coalesced']}, "
+          f"dropped {n['dropped']}, sent {n['sent']}, failed {n['failed']}, "
+          f"received by stand-in {r['api_received']}")
+
+
+def find_max(harness, devices, start_rate, stage_s, max_lag_s):
+    """Doubles the per-device rate until readings drop, lag, or writes fall behind."""
+    rate, best = start_rate, None
+    while True:
+        names = list(harness.ports)[:devices]
+        stage = synthetic_trace(devices, rate, stage_s, seed=int(rate))
+        r = harness.run(dict(zip(names, stage.values())))
+        lag = sorted(r["parse_lag"])
+        p99 = lag[int(0.99 * (len(lag) - 1))] if lag else 0
+        ok = (r["dropped"] <= 0.005 * r["lines_written"] and p99 <= max_lag_s
+              and r["achieved_rate"] >= 0.95 * devices * rate)
+        print(f"{devices * rate:>10.0f} readings/s  achieved {r['achieved_rate']:>8.0f}/s  "
+              f"dropped {r['dropped']:>6}  parse p99 {p99 * 1000:>8.1f} ms  {'ok' if ok else 'FAIL'}")
+        if not ok:
+            return best
+        best = devices * rate
+        rate *= 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="CSV trace to replay; synthetic data if omitted")
+    parser.add_argument("--history", help="history.db to replay instead of a CSV trace")
+    parser.add_argument("--device", help="only replay this device from --history")
+    parser.add_argument("--offline", action="store_true",
+                        help="batch-condition the traces and evaluate the rules only, no ports or notifier")
+    parser.add_argument("--rules", default=os.path.join(ROOT, "rules.json"), help="rule file for --offline")
+    parser.add_argument("--window", type=int, default=16, help="conditioning window for --offline")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up for --trace")
+    parser.add_argument("--devices", type=int, default=1, help="synthetic devices")
+    parser.add_argument("--rate", type=float, default=1.0, help="synthetic readings/s per device")
+    parser.add_argument("--duration", type=float, default=30.0, help="synthetic trace length in seconds")
+    parser.add_argument("--api-delay-ms", type=float, default=50.0, help="stand-in Pushbullet response time")
+    parser.add_argument("--api-fail-rate", type=float, default=0.0, help="fraction of pushes answered with 503")
+    parser.add_argument("--find-max", action="store_true", help="ramp the rate to find the sustainable maximum")
+    parser.add_argument("--stage-seconds", type=float, default=5.0)
+    parser.add_argument("--max-lag-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    if args.history:
+        traces = load_history(args.history, args.device)
+    elif args.trace:
+        traces = load_trace(args.trace)
+    else:
+        traces = synthetic_trace(args.devices, args.rate, args.duration)
+
+    if args.offline:
+        print(f"Evaluating {sum(len(r) for r in traces.values())} readings from {len(traces)} devices offline...")
+        evaluate_offline(traces, args.rules, args.window)
+        return
+
+    harness = Harness(list(traces), args.api_delay_ms / 1000, args.api_fail_rate)
+
+    if args.find_max:
+        best = find_max(harness, len(traces), max(args.rate, 1.0), args.stage_seconds, args.max_lag_ms / 1000)
+        print(f"max sustainable: {best or 0:.0f} readings/s across {len(traces)} devices")
+        return
+
+    print(f"Replaying {sum(len(r) for r in traces.values())} readings from {len(traces)} devices...")
+    report(harness.run(traces, args.speed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Production entry point: stateless web workers fed by a single ingestion process.
+
+    python app.py --ingest
+    gunicorn -w 4 -k gthread --threads 64 -b 0.0.0.0:8000 wsgi:app
+
+Each worker follows the ingestion process over HAZARD_BUS (a Unix socket by
+default, tcp://127.0.0.1:5701 on Windows) and serves /data, /stream and the
+rest from that feed. Don't use gunicorn's --preload: the bus subscriber thread
+has to start inside each worker.
+"""
+from app import app, start_web
+
+start_web()